@@ -0,0 +1,84 @@
+# packs rectangles into power of two pages.
+# MaxRects, best short side fit: https://github.com/juj/RectangleBinPack
+
+def next_power_of_two(x:int) -> int:
+	p = 1
+	while p < x:
+		p *= 2
+	return p
+
+class MaxRects:
+	def __init__(self, width:int, height:int):
+		self.width = width
+		self.height = height
+		self.free = [(0, 0, width, height)]
+		self.used_width = 0
+		self.used_height = 0
+
+	def insert(self, w:int, h:int):
+		best = None
+		best_short = best_long = float("inf")
+
+		for fx, fy, fw, fh in self.free:
+			if w <= fw and h <= fh:
+				short = min(fw - w, fh - h)
+				long = max(fw - w, fh - h)
+				if short < best_short or (short == best_short and long < best_long):
+					best = (fx, fy, w, h)
+					best_short, best_long = short, long
+
+		if best == None:
+			return None
+
+		self._split(best)
+		self.used_width = max(self.used_width, best[0] + w)
+		self.used_height = max(self.used_height, best[1] + h)
+		return best[0], best[1]
+
+	def _split(self, used):
+		ux, uy, uw, uh = used
+		out = []
+		for free in self.free:
+			fx, fy, fw, fh = free
+
+			# untouched
+			if ux >= fx + fw or ux + uw <= fx or uy >= fy + fh or uy + uh <= fy:
+				out.append(free)
+				continue
+
+			if ux > fx: out.append((fx, fy, ux - fx, fh))
+			if ux + uw < fx + fw: out.append((ux + uw, fy, fx + fw - ux - uw, fh))
+			if uy > fy: out.append((fx, fy, fw, uy - fy))
+			if uy + uh < fy + fh: out.append((fx, uy + uh, fw, fy + fh - uy - uh))
+
+		# drop free rects inside other free rects
+		self.free = [a for i, a in enumerate(out) if not any(
+			i != j and _contains(b, a) and (a != b or j < i)
+			for j, b in enumerate(out))]
+
+def _contains(a, b) -> bool:
+	return a[0] <= b[0] and a[1] <= b[1] and a[0] + a[2] >= b[0] + b[2] and a[1] + a[3] >= b[1] + b[3]
+
+def pack(sizes:list, max_size:int) -> tuple:
+	# returns a (page, x, y) for every size, and the (w, h) of every page.
+	# sizes must fit in max_size.
+	order = sorted(range(len(sizes)), key=lambda i: (-max(sizes[i]), -min(sizes[i])))
+	placed = [None] * len(sizes)
+	pages = []
+
+	for i in order:
+		w, h = sizes[i]
+		for page_index, page in enumerate(pages):
+			pos = page.insert(w, h)
+			if pos != None:
+				break
+		else:
+			page = MaxRects(max_size, max_size)
+			pages.append(page)
+			page_index = len(pages) - 1
+			pos = page.insert(w, h)
+
+		placed[i] = (page_index, pos[0], pos[1])
+
+	page_sizes = [(next_power_of_two(p.used_width), next_power_of_two(p.used_height)) for p in pages]
+	return placed, page_sizes
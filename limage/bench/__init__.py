@@ -0,0 +1,2 @@
+# limage bench, see run.py and the README.
+from .run import main, run
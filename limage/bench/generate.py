@@ -0,0 +1,239 @@
+# synthetic layered documents for benchmarks.
+# every format is written from the same layer tree, so timings can be compared between them.
+import io, re, random, zipfile
+from xml.sax.saxutils import quoteattr
+import numpy
+from PIL import Image
+
+try:
+	import lzf
+except ImportError:
+	lzf = None
+
+DEFAULT_SPEC:dict = {
+	"layers": 50,			# paint layers, groups are added on top of these
+	"width": 1024,
+	"height": 1024,
+	"depth": 1,				# levels of groups
+	"group_size": 4,		# children per group
+	"tags": 0.2,			# share of layers and groups with a tag
+	"fill": "sparse",		# "sparse": a shape on each layer, "dense": every layer covers the canvas
+	"seed": 0,
+}
+
+# tags that change what a build does, without dropping the layer.
+LAYER_TAGS:list = ["!crop", "visible", "xdat", "id={}"]
+GROUP_TAGS:list = ["merge", "(part)", "((deep))"]
+
+FORMATS:list = [".kra", ".ora", ".psd"]
+
+def get_spec(**spec) -> dict:
+	for k in spec:
+		if not k in DEFAULT_SPEC:
+			raise TypeError(f"unknown spec option '{k}'")
+	return { **DEFAULT_SPEC, **spec }
+
+def make_tree(spec:dict) -> list:
+	# layers are dicts, listed top first like in the files.
+	# pixels aren't made here, see get_pixels.
+	rand = random.Random(spec["seed"])
+	w, h = spec["width"], spec["height"]
+	
+	def tagged(name:str, tags:list, i:int) -> str:
+		if rand.random() >= spec["tags"]:
+			return name
+		tag = rand.choice(tags).format(i)
+		return f"{name} {tag}" if tag.startswith("(") else f"{name} [{tag}]"
+	
+	nodes = []
+	for i in range(spec["layers"]):
+		if spec["fill"] == "dense":
+			x, y, lw, lh = 0, 0, w, h
+		else:
+			lw = rand.randint(max(w // 16, 1), max(w // 4, 1))
+			lh = rand.randint(max(h // 16, 1), max(h // 4, 1))
+			x, y = rand.randint(0, w - lw), rand.randint(0, h - lh)
+		nodes.append({
+			"name": tagged(f"layer{i}", LAYER_TAGS, i),
+			"x": x, "y": y, "w": lw, "h": lh,
+			"seed": spec["seed"] * 100003 + i,
+			"opacity": 1.0 if rand.random() < 0.8 else round(rand.uniform(0.3, 1.0), 2),
+		})
+	
+	# wrap runs of siblings in groups, one level at a time.
+	size = max(spec["group_size"], 1)
+	for depth in range(spec["depth"]):
+		nodes = [{
+			"name": tagged(f"group{depth}_{i}", GROUP_TAGS, i),
+			"layers": nodes[j:j+size],
+		} for i, j in enumerate(range(0, len(nodes), size))]
+	return nodes
+
+def walk(nodes:list):
+	for n in nodes:
+		yield n
+		if "layers" in n:
+			yield from walk(n["layers"])
+
+def get_pixels(node:dict, spec:dict):
+	# rgba uint8, node["h"] x node["w"]. a shaded colour with some noise, so it doesn't compress to nothing.
+	rng = numpy.random.default_rng(node["seed"])
+	w, h = node["w"], node["h"]
+	
+	out = numpy.empty((h, w, 4), dtype=numpy.uint8)
+	shade = (numpy.arange(w)[None, :] + numpy.arange(h)[:, None]) * 96 // max(w + h, 1)
+	noise = rng.integers(0, 24, (h, w, 3), dtype=numpy.uint8)
+	out[..., :3] = (rng.integers(0, 128, 3) + shade[..., None] + noise).astype(numpy.uint8)
+	
+	if spec["fill"] == "dense":
+		out[..., 3] = 255
+	else:
+		# an ellipse filling the layer.
+		yy = (numpy.arange(h)[:, None] + 0.5) / h * 2 - 1
+		xx = (numpy.arange(w)[None, :] + 0.5) / w * 2 - 1
+		out[..., 3] = numpy.where(xx * xx + yy * yy <= 1.0, 255, 0)
+	return out
+
+# lzf, https://github.com/ning/compress/wiki/LZFFormat
+# short repeating units become back references, everything else literal runs.
+# it compresses worse than liblzf, but it's valid lzf and fast enough for big documents.
+_REPEAT = re.compile(rb"(.{1,4}?)\1{2,}", re.S)
+
+def lzf_compress_python(data:bytes) -> bytes:
+	out = bytearray()
+	
+	def literals(chunk):
+		for i in range(0, len(chunk), 32):
+			part = chunk[i:i+32]
+			out.append(len(part) - 1)
+			out.extend(part)
+	
+	start = 0
+	for m in _REPEAT.finditer(data):
+		unit = len(m.group(1))
+		left = m.end() - m.start() - unit
+		if left < 3:
+			continue
+		
+		# the first unit is written as is, the rest points back at it.
+		literals(data[start:m.start() + unit])
+		while left >= 3:
+			n = min(left, 264)
+			if n == 264 and left - n in (1, 2):
+				n -= 3
+			if n - 2 < 7:
+				out += bytes(((n - 2) << 5 | (unit - 1) >> 8, (unit - 1) & 0xff))
+			else:
+				out += bytes((7 << 5 | (unit - 1) >> 8, n - 2 - 7, (unit - 1) & 0xff))
+			left -= n
+		start = m.end() - left
+	
+	literals(data[start:])
+	return bytes(out)
+
+def lzf_compress(data:bytes):
+	# compressed bytes, or None if it doesn't get smaller (krita stores those raw).
+	if lzf != None:
+		return lzf.compress(data)
+	out = lzf_compress_python(data)
+	return out if len(out) < len(data) else None
+
+def kra_tiles(pixels, x:int, y:int, size:int=64) -> bytes:
+	# krita's tiled layer format: planar bgra tiles on a grid from 0, 0. empty tiles are left out.
+	h, w = pixels.shape[:2]
+	x0, y0 = x // size * size, y // size * size
+	grid = numpy.zeros((-(-(y + h - y0) // size) * size, -(-(x + w - x0) // size) * size, 4), dtype=numpy.uint8)
+	grid[y-y0:y-y0+h, x-x0:x-x0+w] = pixels
+	
+	tiles = []
+	for ty in range(0, grid.shape[0], size):
+		for tx in range(0, grid.shape[1], size):
+			tile = grid[ty:ty+size, tx:tx+size]
+			if not tile[..., 3].any():
+				continue
+			
+			planar = tile[..., [2, 1, 0, 3]].transpose(2, 0, 1).tobytes()
+			packed = lzf_compress(planar)
+			flag, body = (1, packed) if packed != None else (0, planar)
+			tiles.append(f"{x0+tx},{y0+ty},LZF,{len(body)+1}\n".encode("ascii") + bytes((flag,)) + body)
+	
+	head = f"VERSION 2\nTILEWIDTH {size}\nTILEHEIGHT {size}\nPIXELSIZE 4\nDATA {len(tiles)}\n".encode("ascii")
+	return head + b"".join(tiles)
+
+def write_kra(nodes:list, spec:dict, f):
+	files = {}
+	
+	def layer_xml(n) -> str:
+		i = len(files)
+		files[f"layer{i}"] = n
+		attrs = f'name={quoteattr(n["name"])} x="0" y="0" visible="1" compositeop="normal" filename="layer{i}" uuid="{{{i}}}"'
+		if "layers" in n:
+			children = "".join(layer_xml(c) for c in n["layers"])
+			return f'<layer {attrs} nodetype="grouplayer" opacity="255"><layers>{children}</layers></layer>'
+		return f'<layer {attrs} nodetype="paintlayer" opacity="{round(n["opacity"] * 255)}"/>'
+	
+	layers = "".join(layer_xml(n) for n in nodes)
+	doc = (f'<?xml version="1.0" encoding="UTF-8"?><DOC xmlns="http://www.calligra.org/DTD/krita">'
+		f'<IMAGE name="bench" width="{spec["width"]}" height="{spec["height"]}"><layers>{layers}</layers></IMAGE></DOC>')
+	
+	# tiles are compressed already, so they're stored.
+	with zipfile.ZipFile(f, "w") as z:
+		z.writestr("mimetype", "application/x-krita")
+		z.writestr("maindoc.xml", doc, compress_type=zipfile.ZIP_DEFLATED)
+		for filename, n in files.items():
+			if not "layers" in n:
+				z.writestr(f"bench/layers/{filename}", kra_tiles(get_pixels(n, spec), n["x"], n["y"]))
+
+def write_ora(nodes:list, spec:dict, f):
+	files = {}
+	
+	def layer_xml(n) -> str:
+		if "layers" in n:
+			children = "".join(layer_xml(c) for c in n["layers"])
+			return f'<stack name={quoteattr(n["name"])}>{children}</stack>'
+		src = f"data/layer{len(files)}.png"
+		files[src] = n
+		return f'<layer name={quoteattr(n["name"])} src="{src}" x="{n["x"]}" y="{n["y"]}" opacity="{n["opacity"]}"/>'
+	
+	layers = "".join(layer_xml(n) for n in nodes)
+	stack = f'<?xml version="1.0" encoding="UTF-8"?><image w="{spec["width"]}" h="{spec["height"]}"><stack>{layers}</stack></image>'
+	
+	# layers are cropped, like gimp and krita write them. no merged image, limage doesn't read it.
+	with zipfile.ZipFile(f, "w") as z:
+		z.writestr("mimetype", "image/openraster")
+		z.writestr("stack.xml", stack, compress_type=zipfile.ZIP_DEFLATED)
+		for src, n in files.items():
+			png = io.BytesIO()
+			Image.fromarray(get_pixels(n, spec), "RGBA").save(png, "PNG", compress_level=1)
+			z.writestr(src, png.getvalue())
+
+def write_psd(nodes:list, spec:dict, f):
+	from psd_tools import PSDImage
+	from psd_tools.api.layers import Group, PixelLayer
+	
+	psd = PSDImage.new("RGBA", (spec["width"], spec["height"]))
+	
+	# layers are added bottom first.
+	def add(parent, nodes):
+		for n in reversed(nodes):
+			if "layers" in n:
+				add(Group.new(parent, n["name"]), n["layers"])
+			else:
+				image = Image.fromarray(get_pixels(n, spec), "RGBA")
+				layer = PixelLayer.frompil(image, parent, n["name"], n["y"], n["x"])
+				layer.opacity = round(n["opacity"] * 255)
+	
+	add(psd, nodes)
+	psd.save(f)
+
+WRITERS:dict = {
+	".kra": write_kra,
+	".ora": write_ora,
+	".psd": write_psd,
+}
+
+def generate(extension:str, spec:dict=None) -> bytes:
+	spec = spec or get_spec()
+	f = io.BytesIO()
+	WRITERS[extension](make_tree(spec), spec, f)
+	return f.getvalue()
@@ -0,0 +1,171 @@
+# small benchmarks for the hot spots, and a check that every lzf decoder agrees.
+import os, time
+import numpy
+from PIL import Image
+
+from .. import shared, trim
+from ..classes import Vec2
+from ..compression import DECOMPRESSORS
+from ..process_kra import _place_tile
+from .generate import lzf_compress_python, lzf
+
+def _best(func, repeat:int) -> float:
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		func()
+		times.append(time.perf_counter() - start)
+	return min(times)
+
+def get_lzf_samples(size:int=64*64*4) -> dict:
+	rng = numpy.random.default_rng(0)
+	return {
+		"zero": bytes(size),
+		"random": os.urandom(size),
+		"low_entropy": rng.integers(0, 4, size, dtype=numpy.uint8).tobytes(),
+		"repeating": b"ab" * (size // 2),
+		"runs": numpy.repeat(rng.integers(0, 256, size // 32, dtype=numpy.uint8), 32).tobytes(),
+	}
+
+def lzf_conformance(repeat:int=20) -> dict:
+	# every sample, compressed by every compressor, must come back the same from every decoder.
+	compressors = { "python": lzf_compress_python }
+	if lzf != None:
+		compressors["native"] = lambda d: lzf.compress(d) or b""
+	
+	results = {}
+	for sample, raw in get_lzf_samples().items():
+		for cname, compress in compressors.items():
+			packed = compress(raw)
+			if not packed:
+				continue
+			for dname, decompress in DECOMPRESSORS.items():
+				out = bytearray(len(raw))
+				ok = decompress(packed, out) == len(raw) and bytes(out) == raw
+				results[f"{sample}/{cname}/{dname}"] = {
+					"ok": ok,
+					"ratio": len(packed) / len(raw),
+					"time": _best(lambda: decompress(packed, out), repeat),
+				}
+	return results
+
+def _place_tile_loop(clrs, tile_bytes, x, y, w, h):
+	# the per pixel loop _place_tile replaced, to compare against.
+	step = w * h
+	for xx in range(w):
+		for yy in range(h):
+			i = xx + yy * h
+			clrs[y+yy, x+xx, 0] = tile_bytes[i + step * 2]
+			clrs[y+yy, x+xx, 1] = tile_bytes[i + step]
+			clrs[y+yy, x+xx, 2] = tile_bytes[i]
+			clrs[y+yy, x+xx, 3] = tile_bytes[i + step * 3]
+
+def place_tiles(size:int=1024, loop_size:int=256, repeat:int=5) -> dict:
+	# a full layer of 64x64 tiles. the old loop is slow, so it gets a smaller layer + one run.
+	tiles = [(x, y, os.urandom(64 * 64 * 4)) for y in range(0, size, 64) for x in range(0, size, 64)]
+	canvas = numpy.zeros((size, size, 4), dtype=numpy.uint8)
+	
+	def place():
+		for x, y, tile in tiles:
+			_place_tile(canvas, tile, x, y, 64, 64)
+	
+	vectorized = _best(place, repeat)
+	
+	loop_tiles = [t for t in tiles if t[0] < loop_size and t[1] < loop_size]
+	loop_canvas = numpy.zeros((loop_size, loop_size, 4), dtype=numpy.uint8)
+	
+	def place_loop():
+		for x, y, tile in loop_tiles:
+			_place_tile_loop(loop_canvas, tile, x, y, 64, 64)
+	
+	loop_time = _best(place_loop, 1)
+	assert numpy.array_equal(loop_canvas, canvas[:loop_size, :loop_size]), "_place_tile doesn't match the per pixel loop"
+	
+	return {
+		"tiles": len(tiles),
+		"time": vectorized,
+		"loop_tiles": len(loop_tiles),
+		"loop_time": loop_time,
+		"speedup": (loop_time / len(loop_tiles)) / (vectorized / len(tiles)),
+	}
+
+def trim_bounds(size:int=2048, repeat:int=5) -> dict:
+	# a shape in the middle of a big, mostly empty layer. packed rgba, just alpha, and PIL's own getbbox.
+	pixels = numpy.zeros((size, size, 4), dtype=numpy.uint8)
+	pixels[size//5:size*4//5, size//7:size*6//7] = 255
+	image = Image.fromarray(pixels, "RGBA")
+	alpha = pixels[..., 3]
+	
+	return {
+		"size": size,
+		"packed": _best(lambda: trim.get_pixel_bounds(pixels), repeat),
+		"alpha": _best(lambda: trim.get_bounds(alpha), repeat),
+		"image": _best(lambda: trim.trim_image(image), repeat),
+		"getbbox": _best(lambda: image.crop(image.getchannel("A").getbbox()), repeat),
+	}
+
+class _Layer:
+	pass
+
+def make_layers(count:int, fan:int=10) -> list:
+	# a deep tree with a "points" group pointing at every 5th layer, depth first.
+	roots = []
+	
+	def add(parent, name:str, group:bool=False):
+		l = _Layer()
+		l._name = name
+		l._parent_layer = parent
+		l._is_group = group
+		l._origin = Vec2(0, 0)
+		if group:
+			l._layers = []
+		(parent._layers if parent else roots).append(l)
+		return l
+	
+	rig = add(None, "rig [points]", True)
+	groups = [add(None, "body", True)]
+	made = []
+	while len(made) < count:
+		i = len(made)
+		l = add(groups[i % len(groups)], f"l{i}", i % fan == 0)
+		made.append(l)
+		if l._is_group:
+			groups.append(l)
+	
+	for l in made[::5]:
+		path = []
+		p = l
+		while p:
+			path.insert(0, p._name)
+			p = p._parent_layer
+		add(rig, "/".join(path))
+	
+	def depth_first(layers):
+		for l in layers:
+			yield l
+			if l._is_group:
+				yield from depth_first(l._layers)
+	return list(depth_first(roots))
+
+def tree(count:int=10000) -> dict:
+	# parsing names and paths, then resolving origins and points.
+	layers = make_layers(count)
+	data = { "settings": { **shared.DEFAULT_SETTINGS, "format": "PNG", "output": "" } }
+	
+	start = time.perf_counter()
+	shared.update_path(layers, data)
+	shared.update_child_tags(layers)
+	shared.determine_drawable(layers)
+	path_time = time.perf_counter() - start
+	
+	start = time.perf_counter()
+	shared.update_origins([], layers, Vec2(0, 0))
+	return { "layers": len(layers), "update_path": path_time, "update_origins": time.perf_counter() - start }
+
+def run(repeat:int=5) -> dict:
+	return {
+		"lzf": lzf_conformance(),
+		"place_tiles": place_tiles(repeat=repeat),
+		"trim": trim_bounds(repeat=repeat),
+		"tree": tree(),
+	}
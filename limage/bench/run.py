@@ -0,0 +1,133 @@
+# limage bench: generates documents, builds them and times every phase.
+# results are json, so runs from different versions can be compared with --compare.
+import os, sys, time, platform, argparse, tempfile
+from pathlib import Path
+
+from .. import __info__, file, util
+from ..limage import process_file, load_processor
+from ..profile import Profile, get_peak_rss
+from ..sink import DirectorySink, MemorySink
+from ..compression import DECOMPRESSORS
+from ..util import _print
+from . import generate, micro
+
+def get_parser() -> argparse.ArgumentParser:
+	spec = generate.DEFAULT_SPEC
+	parser = argparse.ArgumentParser(prog="limage bench", description="Build synthetic documents and time every phase.")
+	parser.add_argument("--formats", default="kra,ora,psd", help="Formats to generate, comma seperated.")
+	parser.add_argument("--layers", type=int, default=spec["layers"], help="Paint layers per document.")
+	parser.add_argument("--size", default=f"{spec['width']}x{spec['height']}", help="Canvas size, WxH.")
+	parser.add_argument("--depth", type=int, default=spec["depth"], help="Levels of groups.")
+	parser.add_argument("--group_size", type=int, default=spec["group_size"], help="Children per group.")
+	parser.add_argument("--tags", type=float, default=spec["tags"], help="Share of layers with a tag, 0 - 1.")
+	parser.add_argument("--fill", default=spec["fill"], choices=["sparse", "dense"], help="A shape on every layer, or layers covering the canvas.")
+	parser.add_argument("--seed", type=int, default=spec["seed"])
+	parser.add_argument("--repeat", type=int, default=3, help="Builds per document, the fastest counts.")
+	parser.add_argument("--jobs", type=int, default=1, help="Same as limage --jobs.")
+	parser.add_argument("--sink", default="memory", choices=["memory", "directory"], help="Keep built files in memory, or write them to a temporary folder.")
+	parser.add_argument("--skip_micro", action="store_true", help="Skip the lzf, tile and layer tree benchmarks.")
+	parser.add_argument("--output", type=str, default="", help="Save results as json.")
+	parser.add_argument("--compare", type=str, default="", help="Earlier results json to compare against.")
+	return parser
+
+def get_system() -> dict:
+	return {
+		"version": __info__.__version__,
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"cpus": os.cpu_count(),
+		"lzf": "native" if "native" in DECOMPRESSORS else "python",
+		"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+	}
+
+def bench_document(path:Path, repeat:int, jobs:int, sink:str) -> dict:
+	load_processor(path.suffix)
+	runs = []
+	textures = 0
+	
+	with tempfile.TemporaryDirectory() as output:
+		args = util.get_args(output=output, jobs=jobs, force=True)
+		for _ in range(repeat):
+			profile = Profile()
+			start = time.perf_counter()
+			with (MemorySink() if sink == "memory" else DirectorySink()) as s:
+				result = process_file(path, True, {}, args=args, sink=s, profile=profile)
+			runs.append({ "total": time.perf_counter() - start, **profile.phases })
+			textures = result["textures"]
+	
+	return {
+		"textures": textures,
+		"counters": profile.counters,
+		"peak_rss": get_peak_rss(),
+		"best": { k: min(r[k] for r in runs) for k in runs[0] },
+		"runs": runs,
+	}
+
+def run(spec:dict, formats:list, repeat:int=3, jobs:int=1, sink:str="memory", skip_micro:bool=False) -> dict:
+	results = { "system": get_system(), "spec": spec, "repeat": repeat, "jobs": jobs, "documents": {} }
+	
+	with tempfile.TemporaryDirectory() as directory:
+		for ext in formats:
+			start = time.perf_counter()
+			raw = generate.generate(ext, spec)
+			generate_time = time.perf_counter() - start
+			
+			path = Path(directory) / f"bench{ext}"
+			with open(path, "wb") as f:
+				f.write(raw)
+			
+			_print(f"{ext}: {len(raw) / 1e6:.1f}MB generated in {generate_time:.2f}s, building...")
+			results["documents"][ext] = { "bytes": len(raw), "generate": generate_time, **bench_document(path, repeat, jobs, sink) }
+	
+	if not skip_micro:
+		_print("micro benchmarks...")
+		results["micro"] = micro.run()
+	return results
+
+def print_results(results:dict, old:dict=None):
+	# the fastest run of every phase. with old results, the old time and the speedup.
+	if old and old["spec"] != results["spec"]:
+		_print("note: comparing against a different document spec.")
+	
+	for ext, doc in results["documents"].items():
+		old_best = util.get(util.get(util.get(old or {}, "documents", {}), ext, {}), "best", {})
+		_print(f"\n{ext}  {doc['textures']} textures, {doc['bytes'] / 1e6:.1f}MB, peak rss {util.get(doc, 'peak_rss', 0) / 1e6:.0f}MB")
+		for phase, t in doc["best"].items():
+			line = f"  {phase:20} {t * 1000:9.1f}ms"
+			if phase in old_best and old_best[phase] > 0:
+				line += f"  {old_best[phase] * 1000:9.1f}ms before  {old_best[phase] / max(t, 1e-9):.2f}x"
+			_print(line)
+	
+	if "micro" in results:
+		m = results["micro"]
+		failed = [k for k, v in m["lzf"].items() if not v["ok"]]
+		_print(f"\nlzf: {len(m['lzf'])} checks, {'all ok' if not failed else 'FAILED: ' + ', '.join(failed)}")
+		p = m["place_tiles"]
+		line = f"place tiles: {p['tiles']} tiles in {p['time'] * 1000:.1f}ms"
+		if "loop_time" in p:
+			line += f", per pixel loop: {p['loop_tiles']} tiles in {p['loop_time'] * 1000:.1f}ms ({p['speedup']:.0f}x faster per tile, same pixels)"
+		_print(line)
+		if "trim" in m:
+			t = m["trim"]
+			_print(f"trim {t['size']}x{t['size']}: rgba {t['packed'] * 1000:.2f}ms, alpha {t['alpha'] * 1000:.2f}ms, image {t['image'] * 1000:.2f}ms, getbbox + crop {t['getbbox'] * 1000:.2f}ms")
+		_print(f"tree: {m['tree']['layers']} layers, update_path {m['tree']['update_path'] * 1000:.1f}ms, update_origins {m['tree']['update_origins'] * 1000:.1f}ms")
+
+def main(argv:list=None):
+	args = get_parser().parse_args(argv)
+	width, height = (int(x) for x in args.size.lower().split("x"))
+	spec = generate.get_spec(layers=args.layers, width=width, height=height, depth=args.depth,
+		group_size=args.group_size, tags=args.tags, fill=args.fill, seed=args.seed)
+	formats = ["." + x.strip(" .") for x in args.formats.split(",")]
+	for ext in formats:
+		if not ext in generate.WRITERS:
+			_print(f"can't generate {ext}, only {', '.join(generate.WRITERS)}.")
+			sys.exit(1)
+	
+	old = file.load(args.compare) if args.compare else None
+	results = run(spec, formats, args.repeat, args.jobs, args.sink, args.skip_micro)
+	print_results(results, old)
+	
+	if args.output:
+		file.save(results, args.output)
+		_print(f"\nsaved: {args.output}")
+	return results
@@ -1,62 +1,71 @@
-class Vec2(dict):
+class Vec2:
+	# plain x, y pair. indexing with "x" / "y" still works like the old dict version.
+	__slots__ = ("x", "y")
+	
 	def __init__(self, x:float=0, y:float=0):
-		if isinstance(x, (tuple, list)):
+		if isinstance(x, (float, int)):
+			self.x, self.y = x, y
+		elif isinstance(x, Vec2):
+			self.x, self.y = x.x, x.y
+		elif isinstance(x, (tuple, list)):
 			self.x, self.y = x[0], x[1]
 		elif isinstance(x, dict):
 			self.x, self.y = x["x"], x["y"]
-		elif isinstance(x, (float, int)):
-			self.x, self.y = x, y
 		else:
 			print("VEC2 ERROR!")
 	
-	@property
-	def x(self):
-		return self["x"]
+	def __getitem__(self, k):
+		if k == "x": return self.x
+		if k == "y": return self.y
+		raise KeyError(k)
 	
-	@property
-	def y(self):
-		return self["y"]
-
-	@x.setter
-	def x(self, x):
-		self["x"] = x
+	def __setitem__(self, k, v):
+		if k == "x": self.x = v
+		elif k == "y": self.y = v
+		else: raise KeyError(k)
 	
-	@y.setter
-	def y(self, y):
-		self["y"] = y
+	def keys(self):
+		return ("x", "y")
 	
-	def __add__(self, obj):
-		if isinstance(obj, (float, int)):
-			return Vec2(self.x + obj, self.y + obj)
+	def to_dict(self) -> dict:
+		return { "x": self.x, "y": self.y }
+	
+	def __eq__(self, obj):
+		if isinstance(obj, Vec2):
+			return self.x == obj.x and self.y == obj.y
+		if isinstance(obj, dict):
+			return obj == self.to_dict()
+		return NotImplemented
+	
+	def __repr__(self):
+		return f"Vec2({self.x}, {self.y})"
+	
+	def _other(self, obj) -> tuple:
+		if type(obj) is Vec2:
+			return obj.x, obj.y
+		elif isinstance(obj, (float, int)):
+			return obj, obj
 		elif isinstance(obj, (tuple, list)):
-			return Vec2(self.x + obj[0], self.y + obj[1])
+			return obj[0], obj[1]
 		elif isinstance(obj, dict):
-			return Vec2(self.x + obj["x"], self.y + obj["y"])
+			return obj["x"], obj["y"]
 		else:
-			return Vec2(self.x + obj.x, self.y + obj.y)
+			return obj.x, obj.y
+	
+	def __add__(self, obj):
+		x, y = self._other(obj)
+		return Vec2(self.x + x, self.y + y)
 	
 	def __sub__(self, obj):
-		if isinstance(obj, (float, int)):
-			return Vec2(self.x - obj, self.y - obj)
-		elif isinstance(obj, (tuple, list)):
-			return Vec2(self.x - obj[0], self.y - obj[1])
-		elif isinstance(obj, dict):
-			return Vec2(self.x - obj["x"], self.y - obj["y"])
-		else:
-			return Vec2(self.x - obj.x, self.y - obj.y)
+		x, y = self._other(obj)
+		return Vec2(self.x - x, self.y - y)
 	
 	def __mul__(self, obj):
-		if isinstance(obj, (float, int)):
-			return Vec2(self.x * obj, self.y * obj)
-		elif isinstance(obj, (tuple, list)):
-			return Vec2(self.x * obj[0], self.y * obj[1])
-		elif isinstance(obj, dict):
-			return Vec2(self.x * obj["x"], self.y * obj["y"])
-		else:
-			return Vec2(self.x * obj.x, self.y * obj.y)
+		x, y = self._other(obj)
+		return Vec2(self.x * x, self.y * y)
 	
 	def negative(self):
 		return Vec2(-self.x, -self.y)
 	
 	def copy(self):
-		return Vec2(self.x, self.y)
\ No newline at end of file
+		return Vec2(self.x, self.y)
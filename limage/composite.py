@@ -0,0 +1,142 @@
+# flattens groups with numpy, for the "merge" tag.
+# works on straight alpha float images, blends follow https://www.w3.org/TR/compositing-1/
+import numpy
+from PIL import Image
+
+from . import trim
+from .util import print_warning
+
+def _hard_light(b, s):
+	return numpy.where(s <= 0.5, b * 2 * s, b + (2 * s - 1) - b * (2 * s - 1))
+
+def _soft_light(b, s):
+	d = numpy.where(b <= 0.25, ((16 * b - 12) * b + 4) * b, numpy.sqrt(b))
+	return numpy.where(s <= 0.5, b - (1 - 2 * s) * b * (1 - b), b + (2 * s - 1) * (d - b))
+
+def _color_dodge(b, s):
+	with numpy.errstate(divide="ignore", invalid="ignore"):
+		out = numpy.minimum(1.0, b / (1 - s))
+	return numpy.where(b == 0, 0.0, numpy.where(s >= 1, 1.0, out))
+
+def _color_burn(b, s):
+	with numpy.errstate(divide="ignore", invalid="ignore"):
+		out = 1 - numpy.minimum(1.0, (1 - b) / s)
+	return numpy.where(b >= 1, 1.0, numpy.where(s <= 0, 0.0, out))
+
+# b is the backdrop, s the layer being drawn.
+BLEND_FUNCTIONS:dict = {
+	"normal": None,
+	"multiply": lambda b, s: b * s,
+	"screen": lambda b, s: b + s - b * s,
+	"overlay": lambda b, s: _hard_light(s, b),
+	"darken": numpy.minimum,
+	"lighten": numpy.maximum,
+	"difference": lambda b, s: numpy.abs(b - s),
+	"exclusion": lambda b, s: b + s - 2 * b * s,
+	"add": lambda b, s: numpy.minimum(b + s, 1.0),
+	"subtract": lambda b, s: numpy.maximum(b - s, 0.0),
+	"linear_burn": lambda b, s: numpy.maximum(b + s - 1, 0.0),
+	"hard_light": _hard_light,
+	"soft_light": _soft_light,
+	"color_dodge": _color_dodge,
+	"color_burn": _color_burn,
+}
+
+# names used by photoshop, krita and openraster.
+BLEND_ALIASES:dict = {
+	"pass_through": "normal",
+	"plus": "add",
+	"linear_dodge": "add",
+	"dodge": "color_dodge",
+	"burn": "color_burn",
+	"diff": "difference",
+	"soft_light_svg": "soft_light",
+}
+
+UNSUPPORTED_BLEND_MODES:set = set()
+
+def get_blend_function(mode:str):
+	mode = BLEND_ALIASES.get(mode, mode)
+	if mode in BLEND_FUNCTIONS:
+		return BLEND_FUNCTIONS[mode]
+	
+	if not mode in UNSUPPORTED_BLEND_MODES:
+		UNSUPPORTED_BLEND_MODES.add(mode)
+		print_warning(f"blend mode '{mode}' not supported in merged groups, using normal.")
+	return None
+
+def blend(canvas, image, x:int, y:int, opacity:float=1.0, mode:str="normal"):
+	# draws image over canvas in place, at x, y.
+	h, w = image.shape[:2]
+	dst = canvas[y:y+h, x:x+w]
+	
+	src_a = image[..., 3:4] * opacity
+	dst_a = dst[..., 3:4]
+	src = image[..., :3]
+	back = dst[..., :3]
+	
+	func = get_blend_function(mode)
+	if func != None:
+		src = (1 - dst_a) * src + dst_a * func(back, src)
+	
+	out_a = src_a + dst_a * (1 - src_a)
+	rgb = src_a * src + (1 - src_a) * dst_a * back
+	dst[..., :3] = numpy.divide(rgb, out_a, out=numpy.zeros_like(rgb), where=out_a > 0)
+	dst[..., 3:4] = out_a
+
+def is_visible(l) -> bool:
+	if "x" in l._tags or "!visible" in l._tags:
+		return False
+	return l._visible or "visible" in l._tags
+
+def to_array(image):
+	return numpy.asarray(image.convert("RGBA"), dtype=numpy.float32) / 255.0
+
+def to_image(canvas):
+	return Image.fromarray((canvas * 255 + 0.5).astype(numpy.uint8), "RGBA")
+
+def merge_group(group, get_image, cache:dict, threshold=0):
+	# returns (canvas, x, y) of the flattened group, or None if nothing is drawn.
+	# threshold is the alpha (0 - 255) to trim the result to.
+	# groups are cached, so nested merges are only drawn once.
+	key = id(group)
+	if key in cache:
+		return cache[key]
+	
+	items = []
+	for c in group._layers:
+		if not is_visible(c):
+			continue
+		
+		if hasattr(c, "_layers"):
+			merged = merge_group(c, get_image, cache, threshold)
+			if merged == None:
+				continue
+			canvas, x, y = merged
+		else:
+			image = get_image(c)
+			if image == None or c._bounds == None:
+				continue
+			canvas = to_array(image)
+			x, y = c._bounds[0], c._bounds[1]
+		
+		items.append((canvas, x, y, c._opacity, c._blend_mode))
+	
+	result = None
+	if items:
+		x0 = min(x for _, x, _, _, _ in items)
+		y0 = min(y for _, _, y, _, _ in items)
+		x1 = max(x + c.shape[1] for c, x, _, _, _ in items)
+		y1 = max(y + c.shape[0] for c, _, y, _, _ in items)
+		
+		canvas = numpy.zeros((y1 - y0, x1 - x0, 4), dtype=numpy.float32)
+		for image, x, y, opacity, mode in items:
+			blend(canvas, image, x - x0, y - y0, opacity, mode)
+		
+		# trim to what was drawn.
+		bounds, canvas = trim.trim(canvas, threshold / 255)
+		if bounds != None:
+			result = canvas, x0 + bounds[0], y0 + bounds[1]
+	
+	cache[key] = result
+	return result
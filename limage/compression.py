@@ -0,0 +1,84 @@
+# LZF decompression for krita tiles.
+# uses the compiled `lzf` module (pip install python-lzf) when it's installed,
+# otherwise falls back to pure python.
+try:
+	import lzf
+except ImportError:
+	lzf = None
+
+# krita writes a flag byte in front of every tile.
+RAW_DATA_FLAG = 0
+COMPRESSED_DATA_FLAG = 1
+
+# https://programtalk.com/python-examples/lzf.decompress/
+# https://github.com/2shady4u/godot-kra-psd-importer/blob/525f433605545a964419934185a98fe865195f11/docs/KRA_FORMAT.md
+# https://github.com/korlibs/korim/commit/d05eff45d0cb156336cf8dd9557731a3ec9243cb#diff-2700b714f88b93eee5490e6c92b54a7f37ec835249e1262a477e5eeaf93469e1
+def lzf_decompress_python(indata, outdata) -> int:
+	# writes into the preallocated outdata, returns number of bytes written.
+	indata = memoryview(indata)
+	outview = memoryview(outdata)
+	iidx = 0
+	oidx = 0
+	in_len = len(indata)
+
+	while iidx < in_len:
+		ctrl = indata[iidx]
+		iidx += 1
+
+		# literal run
+		if ctrl < 32:
+			ctrl += 1
+			outview[oidx:oidx+ctrl] = indata[iidx:iidx+ctrl]
+			oidx += ctrl
+			iidx += ctrl
+
+		# back reference
+		else:
+			lenn = ctrl >> 5
+			if lenn == 7:
+				lenn += indata[iidx]
+				iidx += 1
+
+			ref = oidx - ((ctrl & 0x1f) << 8) - indata[iidx] - 1
+			iidx += 1
+			lenn += 2
+
+			if ref + lenn <= oidx:
+				outview[oidx:oidx+lenn] = outview[ref:ref+lenn]
+
+			# overlapping reference repeats the last (oidx - ref) bytes.
+			else:
+				pattern = bytes(outview[ref:oidx])
+				repeat = -(-lenn // len(pattern))
+				outview[oidx:oidx+lenn] = (pattern * repeat)[:lenn]
+
+			oidx += lenn
+
+	return oidx
+
+def lzf_decompress_native(indata, outdata) -> int:
+	out = lzf.decompress(bytes(indata), len(outdata))
+	if out is None:
+		raise ValueError("lzf data larger than tile")
+	memoryview(outdata)[:len(out)] = out
+	return len(out)
+
+DECOMPRESSORS:dict = {
+	"python": lzf_decompress_python,
+}
+
+if lzf is not None:
+	DECOMPRESSORS["native"] = lzf_decompress_native
+
+def get_decompressor(name:str=None):
+	if name is None:
+		name = "native" if "native" in DECOMPRESSORS else "python"
+	return DECOMPRESSORS[name]
+
+lzf_decompress = get_decompressor()
+
+def decompress_tile(flag:int, indata, outdata, decompress=None) -> int:
+	if flag == RAW_DATA_FLAG:
+		memoryview(outdata)[:len(indata)] = indata
+		return len(indata)
+	return (decompress or lzf_decompress)(indata, outdata)
@@ -1,5 +1,6 @@
 from pathlib import Path
-import json, yaml, math
+from contextlib import contextmanager
+import os, json, yaml, math, hashlib, threading
 from . import util
 from .util import print, print_error, print_warning, get
 
@@ -26,6 +27,13 @@ def size(p) -> str:
 	p = Path(p)
 	return "" if not p.exists() else f"({nice_bytes(p.stat().st_size, 1)})"
 
+def checksum(p) -> str:
+	h = hashlib.blake2b(digest_size=16)
+	with open(p, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			h.update(chunk)
+	return h.hexdigest()
+
 def nice_bytes(size:int, precision:int=2) -> str:
 	for suffix in ["b", "kb", "mb", "gb", "tp", "pb"]:
 		if size > 1024:
@@ -84,6 +92,18 @@ def make_dir(directory):
 		directory.mkdir(parents=True)
 		print(f"created {directory}")
 
+@contextmanager
+def atomic(path):
+	# write to a temp file next to path, then swap it in, so nothing ever sees half a file.
+	path = Path(path)
+	tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+	try:
+		yield tmp
+		os.replace(tmp, path)
+	finally:
+		if tmp.exists():
+			tmp.unlink()
+
 def load(path, default=None, **kwargs):
 	path = Path(path)
 	loader = path.suffix
@@ -116,7 +136,8 @@ def save(data, path, **kwargs):
 	
 	make_dir(path.parent)
 	
-	with open(path, "w") as file:
-		FILE_SAVE[saver](file, path, data, **kwargs)
+	with atomic(path) as tmp:
+		with open(tmp, "w") as file:
+			FILE_SAVE[saver](file, path, data, **kwargs)
 	
 	print(f"saved: {path}")
\ No newline at end of file
@@ -1,8 +1,11 @@
-import sys, os, json
+import sys, os, json, time, glob, threading
 import importlib
 from pathlib import Path
-from . import __info__, file, util
-from .util import get, print, print_warning, print_error, EXTENSIONS
+from concurrent.futures import ProcessPoolExecutor
+from . import __info__, file, util, table, watch
+from .sink import DirectorySink, get_sink
+from .profile import Profile, NO_PROFILE
+from .util import get, _print, print, print_warning, print_error, print_report, EXTENSIONS
 
 __version__ = __info__.__version__
 
@@ -24,12 +27,29 @@ def get_current_directory():
 
 # process current directory
 def main():
-	process_file()
+	if sys.argv[1:2] == ["watch"]:
+		util.init(sys.argv[2:])
+		watch.run(util.ARGS.path, process_file)
+		return
+	
+	if sys.argv[1:2] == ["bench"]:
+		from . import bench
+		bench.main(sys.argv[2:])
+		return
+	
+	util.init()
+	start = time.perf_counter()
+	paths = get_input_paths(util.ARGS.path)
+	with get_sink(util.ARGS) as sink:
+		results = process_files(paths, sink)
+	if len(results) > 1:
+		print_summary(results, time.perf_counter() - start)
 
-def build() -> dict:
-	process_file()
-	path = util.ARGS.output / ("." + util.ARGS.path.stem + ".json")
-	with open(path, "r") as file:
+def build(path=None) -> dict:
+	util.init(None if path == None else [str(path)])
+	path = get_input_paths(util.ARGS.path)[0]
+	result = process_file(path)
+	with open(result["data"], "r") as file:
 		data = json.load(file)
 	return data
 
@@ -44,51 +64,252 @@ def hide_name(path):
 def get_texture_directory(data):
 	return Path(data["directory"]) / Path(data["settings"]["directory"])
 
+def get_input_paths(items:list) -> list:
+	paths = []
+	for item in items:
+		p = Path(item)
+		if p.is_dir():
+			found = file.get_paths(p, [], extensions=EXTENSIONS)
+		elif not p.exists():
+			found = [Path(x) for x in glob.glob(item, recursive=True)]
+			found = [x for x in found if x.suffix in EXTENSIONS and not x.name.startswith(".")]
+		else:
+			found = [p]
+		util.append_unique(paths, sorted(found))
+	return paths
+
 def process_directory(directory):
-	directory = Path(directory)
+	if not util.ARGS:
+		util.init([str(directory)])
+	return process_files(get_input_paths([directory]))
+
+def load_processor(extension:str):
+	if not extension in PROCESSORS:
+		ext2 = extension[1:]
+		PROCESSORS[extension] = importlib.import_module(f".process_{ext2}", package="limage")
+	return PROCESSORS[extension]
+
+def process_files(paths:list, sink=None) -> list:
+	batch = len(paths) > 1
+	
+	if not paths:
+		_print(f"no files of type {EXTENSIONS} found.")
+		return []
 	
-	for path in file.get_paths(directory, [], extensions=EXTENSIONS):
-		process_file(path)
+	# import processors once, so workers share them.
+	for path in paths:
+		load_processor(path.suffix)
+	
+	# files that would build into the same folder are left out, the first one is built.
+	owners = {}
+	errors = {}
+	if batch:
+		for path in paths:
+			try:
+				claim_output(path, owners)
+			except ValueError as e:
+				print_error(e, path)
+				errors[path] = _get_error_result(path)
+	todo = [path for path in paths if not path in errors]
+	
+	# bundles can't be shared between processes, their files are built one by one.
+	jobs = util.ARGS.jobs
+	if batch and jobs > 1 and (sink == None or isinstance(sink, DirectorySink)):
+		# files are spread over processes, so each file exports its layers serially.
+		args = util.ARGS
+		args.jobs = 1
+		with ProcessPoolExecutor(jobs, initializer=util.set_args, initargs=(args,)) as pool:
+			results = iter(list(pool.map(_process_file_safe, todo, [batch] * len(todo))))
+		args.jobs = jobs
+	else:
+		results = (_process_file_safe(path, batch, sink) for path in todo)
+	
+	return [errors[path] if path in errors else next(results) for path in paths]
 
-def make_json_safe(d):
-	# make json safe for serialize
-	for k in d:
-		if not isinstance(d[k], (dict,list,tuple,str,int,float,bool)):
-			print("JSON ", d[k])
-			d[k] = str(d[k])
+def claim_output(path, owners:dict, args=None):
+	# hero.psd + hero.kra would write over each other's folder + json. owners is output folder: file building into it.
+	output = util.get_output(path, True, args)
+	owner = owners.setdefault(output, path.resolve())
+	if owner != path.resolve():
+		raise ValueError(f"{path} and {owner} would both build into {output}, rename one of them or use another output.")
 
-def process_file():
-	global PROCESSORS
+def _process_file_safe(path, batch:bool=False, sink=None) -> dict:
+	# a broken file shouldn't stop the rest of the batch.
+	# documents are dropped, they're on disk and a big batch would hold all of them.
+	if not batch:
+		return _drop_document(process_file(path, sink=sink))
 	
-	util.init()
-	path = util.ARGS.path
+	try:
+		return _drop_document(process_file(path, batch, sink=sink))
+	except Exception as e:
+		print_error(e, path)
+		return _get_error_result(path)
+
+def _get_error_result(path) -> dict:
+	return { "path": str(path), "status": "error", "time": 0.0, "textures": 0, "data": None, "build": None }
+
+def _drop_document(result:dict) -> dict:
+	result.pop("document", None)
+	return result
+
+def print_summary(results:list, wall_time:float):
+	total_time = 0.0
+	total_textures = 0
+	counts = {}
+	
+	_print("")
+	for r in results:
+		_print(f"{r['status']:>8}  {r['time']:7.2f}s  {r['textures']:5} textures  {r['path']}")
+		total_time += r["time"]
+		total_textures += r["textures"]
+		counts[r["status"]] = get(counts, r["status"], 0) + 1
+	
+	counts = ", ".join(f"{v} {k}" for k, v in counts.items())
+	_print(f"{len(results)} files ({counts}) {total_textures} textures in {wall_time:.2f}s ({total_time:.2f}s total)")
+
+# args that don't change what gets built.
+BUILD_IGNORED_ARGS:list = ["path", "print", "quiet", "jobs", "memory", "force", "skip_images", "poll", "debounce", "sink", "profile"]
+
+def get_source_info(path, old:dict) -> dict:
+	stat = path.stat()
+	info = { "mtime": stat.st_mtime, "size": stat.st_size }
+	
+	# only hash again if the file was touched.
+	if get(old, "mtime") == info["mtime"] and get(old, "size") == info["size"]:
+		info["hash"] = old["hash"]
+	else:
+		info["hash"] = file.checksum(path)
+	return info
+
+def get_settings_checksum(settings:dict, args=None) -> str:
+	args = {k: v for k, v in vars(args or util.ARGS).items() if not k in BUILD_IGNORED_ARGS}
+	return util.checksum(settings, args, __version__)
+
+def is_unchanged(old_build:dict, build:dict) -> bool:
+	return (get(old_build, "version") == build["version"]
+		and get(old_build, "settings") == build["settings"]
+		and get(get(old_build, "source", {}), "hash") == build["source"]["hash"])
+
+def has_textures(sink, old_build:dict, texture_dir) -> bool:
+	# textures that were deleted since are built again, even if nothing else changed.
+	return all(sink.exists(Path(os.path.normpath(Path(texture_dir) / texture))) for texture in get(old_build, "layers", {}))
+
+def load_data(sink, info_path) -> dict:
+	raw = sink.read(info_path)
+	return {} if raw == None else json.loads(raw)
+
+def process_file(path=None, batch:bool=False, old_build:dict=None, args=None, sink=None, settings:dict=None, profile=None) -> dict:
+	# without args, this is the command line: global ARGS, a log file next to the output.
+	# with args, nothing global is touched, so builds can run side by side.
+	if args == None:
+		if not util.ARGS:
+			util.init()
+		args = util.ARGS
+		log = True
+	else:
+		log = False
+	
+	sink = sink or DirectorySink()
+	profile = profile or (Profile() if args.profile else NO_PROFILE)
+	path = Path(path) if path else get_input_paths(args.path)[0]
+	start = time.perf_counter()
+	
+	output = util.get_output(path, batch, args)
+	if log and isinstance(sink, DirectorySink):
+		output.mkdir(parents=True, exist_ok=True)
+		util.init_log(output / f".{path.stem}.log")
 	
-	# find settings
-	settings_path, settings_time, settings = get_settings(path)
+	with profile.phase("source"):
+		# find settings, the caller's win.
+		settings_path, settings_time, file_settings = get_settings(path)
+		settings = util.merge(file_settings, settings or {})
+		
+		# check for old data, unless the caller kept it.
+		info_path = output / ("." + path.stem + ".json")
+		if old_build == None:
+			old_build = get(load_data(sink, info_path), "build", {})
+		
+		build = {
+			"version": __version__,
+			"source": get_source_info(path, get(old_build, "source", {})),
+			"settings": get_settings_checksum(settings, args),
+			"layers": {} if args.force else get(old_build, "layers", {}), # replaced with current layer checksums.
+		}
+	
+	result = { "path": str(path), "status": "skipped", "time": 0.0, "textures": len(build["layers"]), "data": info_path, "build": old_build }
+	
+	if not args.force and is_unchanged(old_build, build) and has_textures(sink, old_build, get(settings, "output", output)):
+		print(f"skipped: {path} (no changes)")
+		result["time"] = time.perf_counter() - start
+		return result
 	
-	# check for old data
 	data = {
 		"name": path.stem,
 		"type": path.suffix,
+		"directory": str(output),
 		"time": file.time(path),
 		"settings_time": settings_time,
 		"settings": settings,
+		"build": build,
+		"args": args, # only while processing
+		"sink": sink,
+		"profile": profile,
 	}
 	
-	# import processor
-	extension = path.suffix
-	if not extension in PROCESSORS:
-		ext2 = extension[1:]
-		PROCESSORS[extension] = importlib.import_module(f".process_{ext2}", package="limage")
-	
 	# process
-	PROCESSORS[extension].process(path, data)
+	with profile.phase("process"):
+		load_processor(path.suffix).process(path, data)
+	del data["args"]
+	del data["sink"]
+	del data["profile"]
+	
+	# save
+	with profile.phase("save"):
+		raw = util.to_json(data, pretty=args.data == "pretty").encode("utf-8")
+		sink.write(info_path, raw)
+		profile.count("written", len(raw))
+		if args.data == "table":
+			raw = table.to_bytes(data)
+			sink.write(output / f".{path.stem}.table", raw)
+			profile.count("written", len(raw))
+	print(f"saved: {info_path}")
 	
-	util.dig(data, make_json_safe)
+	# timings go in the log (even with --quiet, they were asked for), and a trace next to the json.
+	# not a .json, or it would be listed as a build.
+	if profile:
+		for line in profile.report():
+			print_report(line)
+	if args.profile:
+		sink.write(output / f".{path.stem}.trace", util.to_json(profile.to_trace()).encode("utf-8"))
+	
+	result["status"] = "built"
+	result["time"] = time.perf_counter() - start
+	result["textures"] = len(build["layers"])
+	result["build"] = build
+	result["document"] = data
+	return result
+
+class Builder:
+	# builds files without sys.argv or global state, so many can run at once (threads or processes).
+	# settings are the same as a settings file next to the image (and win over it),
+	# options are the command line flags by name: Builder(output="out", jobs=4).
+	def __init__(self, settings:dict=None, sink=None, **options):
+		self.settings = settings or {}
+		self.sink = sink or DirectorySink()
+		self.args = util.get_args(**options)
+		self.outputs = {} # output folder: file building into it
+		self.lock = threading.Lock()
 	
-	# save to disk
-	info_path = util.ARGS.output / ("." + path.stem + ".json")
-	file.save(data, info_path, pretty=True)
+	def build(self, path) -> dict:
+		# the built document, same as the json: plain dicts + lists, whether it was built or skipped.
+		# every file gets its own folder in the "output" option, or next to it, named after the file.
+		path = Path(path)
+		with self.lock:
+			claim_output(path, self.outputs, self.args)
+		result = process_file(path, True, args=self.args, sink=self.sink, settings=dict(self.settings))
+		if "document" in result:
+			return json.loads(util.to_json(result["document"]))
+		return load_data(self.sink, result["data"])
 
 def _on_all_layers(l, func):
 	func(l)
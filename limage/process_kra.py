@@ -2,32 +2,40 @@ from xml.etree import ElementTree as ET
 import numpy, zipfile, io, random
 from PIL import Image
 
-from . import util, shared, classes
+from . import util, shared, classes, trim
+from .compression import decompress_tile
 from .util import get, print, _print, print_error, print_warning
 from .classes import Vec2
+from .profile import get_profile, NO_PROFILE
 
 def process(path, data:dict):
-	file = KRARoot(path)
-	wide, high = file.width, file.height
-	layers = file.layers_recursive()
-	root_layers = [l for l in file.layers]
-	
-	for l in layers:
-		l._name = l.name
-		l._is_group = l.nodetype == "grouplayer"
-		l._is_clone = l.nodetype == "clonelayer"
-		l._parent_layer = None if l.parent == None else l.parent
-		
-		l._bounds = l.get_bounds()
-		l._visible = l.visible
-		l._opacity = l.opacity
-		l._blend_mode = l.blend_mode
+	with KRARoot(path, get_profile(data), shared.get_settings(data)["trim_threshold"]) as file:
+		_process(file, data)
+
+def _process(file, data:dict):
+	with get_profile(data).phase("read"):
+		wide, high = file.width, file.height
+		layers = file.layers_recursive()
+		root_layers = [l for l in file.layers]
 		
-		l.visible = True
-		l.opacity = 1.0
+		for l in layers:
+			l._name = l.name
+			l._is_group = l.nodetype == "grouplayer"
+			l._is_clone = l.nodetype == "clonelayer"
+			l._parent_layer = None if l.parent == None else l.parent
+			
+			l._bounds = l.get_bounds()
+			l._visible = l.visible
+			l._opacity = l.opacity
+			l._blend_mode = l.blend_mode
+			
+			l.visible = True
+			l.opacity = 1.0
+			
+			if l._is_group:
+				l._layers = [x for x in l.layers]
 		
-		if l._is_group:
-			l._layers = [x for x in l.layers]
+		shared.union_group_bounds(layers, lambda c: c.has_pixels())
 	
 	def get_image(l):
 		return l.get_image_data()
@@ -64,21 +72,35 @@ class KRABase:
 		return out
 
 class KRARoot(KRABase):
-	def __init__(self, filepath):
+	def __init__(self, filepath, profile=NO_PROFILE, threshold:int=0):
 		self.filepath = filepath
+		self.profile = profile
+		self.threshold = threshold # alpha to trim layers to
 		
-		with zipfile.ZipFile(filepath, "r") as kra_file:
-			maindoc = kra_file.open("maindoc.xml")
-			root = ET.parse(maindoc).getroot()
-			
-			IMAGE = root.find("{http://www.calligra.org/DTD/krita}IMAGE")
-			self.name = IMAGE.attrib["name"]
-			self.width = int(IMAGE.attrib["width"])
-			self.height = int(IMAGE.attrib["height"])
-			
-			layers = IMAGE.find("{http://www.calligra.org/DTD/krita}layers")
-			self.layers = [KRALayer(x, self, None) for x in layers]
-			self.layers.reverse()
+		# kept open for the layers, and indexed once.
+		self.zip = zipfile.ZipFile(filepath, "r")
+		self.names = set(self.zip.namelist())
+		
+		maindoc = self.zip.open("maindoc.xml")
+		root = ET.parse(maindoc).getroot()
+		
+		IMAGE = root.find("{http://www.calligra.org/DTD/krita}IMAGE")
+		self.name = IMAGE.attrib["name"]
+		self.width = int(IMAGE.attrib["width"])
+		self.height = int(IMAGE.attrib["height"])
+		
+		layers = IMAGE.find("{http://www.calligra.org/DTD/krita}layers")
+		self.layers = [KRALayer(x, self, None) for x in layers]
+		self.layers.reverse()
+	
+	def close(self):
+		self.zip.close()
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, *args):
+		self.close()
 
 class KRALayer(KRABase):
 	def __init__(self, data, root, parent):
@@ -95,7 +117,6 @@ class KRALayer(KRABase):
 		self.blend_mode = data.attrib["compositeop"]
 		self.filename = data.attrib["filename"]
 		self.bbox = (self.x,self.y,self.x+1,self.y+1)
-		self.imagedata = None
 		
 		self.uuid = data.attrib["uuid"]
 		
@@ -119,183 +140,168 @@ class KRALayer(KRABase):
 	def _collect_shapes(self):
 		self.shapes = []
 		
-		with zipfile.ZipFile(self.root.filepath, "r") as kra_file:
-			path = f"{self.root.name}/layers/{self.filename}.shapelayer/content.svg"
-			if not path in kra_file.namelist():
-				return
+		path = f"{self.root.name}/layers/{self.filename}.shapelayer/content.svg"
+		if not path in self.root.names:
+			return
+		
+		file = self.root.zip.open(path)
+		root = ET.parse(file).getroot()
+		
+		for p in root:
+			tag = p.tag[len("{http://www.w3.org/2000/svg}"):]#, p.attrib.keys())
+			
+			if tag == "path":
+				x, y = p.attrib["transform"][len("translate("):-1].split(",")
+				points = p.attrib["d"][1:-1].split(" ")
+				self.shapes.append({
+					"type": "path",
+					"x": float(x),
+					"y": float(y),
+					"color": p.attrib["fill"],
+					"points": points
+					})
 			
-			file = kra_file.open(path)
-			root = ET.parse(file).getroot()
+			elif tag == "ellipse":
+				x, y = p.attrib["transform"][len("translate("):-1].split(",")
+				rx, ry = p.attrib["rx"], p.attrib["rx"]
+				self.shapes.append({
+					"type": "ellipse",
+					"x": float(x),
+					"y": float(y),
+					"rx": float(rx),
+					"ry": float(ry),
+					"color": p.attrib["fill"],
+				})
 			
-			for p in root:
-				tag = p.tag[len("{http://www.w3.org/2000/svg}"):]#, p.attrib.keys())
-				
-				if tag == "path":
-					x, y = p.attrib["transform"][len("translate("):-1].split(",")
-					points = p.attrib["d"][1:-1].split(" ")
-					self.shapes.append({
-						"type": "path",
-						"x": float(x),
-						"y": float(y),
-						"color": p.attrib["fill"],
-						"points": points
-						})
+			elif tag == "text":
+				x, y = p.attrib["transform"][len("translate("):-1].split(",")
+				text = p.text
+				for pp in p:
+					text = pp.text
 				
-				elif tag == "ellipse":
-					x, y = p.attrib["transform"][len("translate("):-1].split(",")
-					rx, ry = p.attrib["rx"], p.attrib["rx"]
-					self.shapes.append({
-						"type": "ellipse",
-						"x": float(x),
-						"y": float(y),
-						"rx": float(rx),
-						"ry": float(ry),
-						"color": p.attrib["fill"],
+				self.shapes.append({
+					"type": "text",
+					"x": float(x),
+					"y": float(y),
+					"text": text
 					})
 				
-				elif tag == "text":
-					x, y = p.attrib["transform"][len("translate("):-1].split(",")
-					text = p.text
-					for pp in p:
-						text = pp.text
-					
-					self.shapes.append({
-						"type": "text",
-						"x": float(x),
-						"y": float(y),
-						"text": text
-						})
-				
 	def get_bounds(self):
-		image = self.get_image_data()
-		if image == None:
+		# bounds come from the tile headers + an alpha scan of each tile,
+		# so the full canvas is never built just to measure it. tiles with nothing above the threshold are skipped.
+		tiles = self._read_tiles()
+		if tiles == None:
 			return (0, 0, 1, 1)
 		
+		w, h, pixel_size, tiles = tiles
+		minx = 999999
+		miny = 999999
+		maxx = -999999
+		maxy = -999999
+		
+		self._filled_tiles = set()
+		buffer = bytearray(w * h * pixel_size)
+		with self.root.profile.layer(self, "bounds"):
+			for x, y, flag, tile_bytes in tiles:
+				decompress_tile(flag, tile_bytes, buffer)
+				alpha = numpy.frombuffer(buffer, dtype=numpy.uint8, count=w*h, offset=w*h*3).reshape(h, w)
+				bounds = trim.get_bounds(alpha, self.root.threshold)
+				if bounds == None:
+					continue
+				
+				self._filled_tiles.add((x, y))
+				minx = min(x + bounds[0], minx)
+				miny = min(y + bounds[1], miny)
+				maxx = max(x + bounds[2], maxx)
+				maxy = max(y + bounds[3], maxy)
+		
+		if len(self._filled_tiles):
+			self.tile_min_x = int(minx)
+			self.tile_min_y = int(miny)
+			self.width = int(maxx - minx)
+			self.height = int(maxy - miny)
+		
 		minx = self.x + self.tile_min_x
 		miny = self.y + self.tile_min_y
 		
 		bounds =  (minx, miny, minx+self.width, miny+self.height)
 		return bounds
-		
-	def get_image_data(self):
+	
+	def has_pixels(self) -> bool:
+		if self.nodetype == "grouplayer":
+			return any(c.has_pixels() for c in self.layers)
+		return bool(getattr(self, "_filled_tiles", None))
+	
+	def _read_tiles(self):
 		if self.nodetype != "paintlayer":
 			return None
 		
-		if self.imagedata:
-			return self.imagedata
+		path = f"{self.root.name}/layers/{self.filename}"
 		
-		with zipfile.ZipFile(self.root.filepath, "r") as kra_file:
-			path = f"{self.root.name}/layers/{self.filename}"
-			
-			# file doesn't exist
-			if not path in kra_file.namelist():
-				return None
-			
-			f = kra_file.read(path)
-			f = io.BytesIO(f)
-			
-			version = int(f.readline().decode("ascii").strip().split(" ")[1])
-			w = int(f.readline().decode("ascii").strip().split(" ")[1])
-			h = int(f.readline().decode("ascii").strip().split(" ")[1])
-			pixel_size = int(f.readline().decode("ascii").strip().split(" ")[1])
-			tile_count = int(f.readline().decode("ascii").strip().split(" ")[1])
-			
-			if tile_count == 0:
-				self.imagedata = Image.fromarray(numpy.zeros((1,1,4), dtype=numpy.uint8), "RGBA")
-				return self.imagedata
-			
-			image_size = (w, h)
-			uncompressed_size = w * h * pixel_size + 1
-			step = uncompressed_size // 4
-			off_g = step
-			off_r = step * 2
-			off_a = step * 3
-			
-			tiles = []
-			minx = 999999
-			miny = 999999
-			maxx = -999999
-			maxy = -999999
-			
-			for i in range(tile_count):
-				line = f.readline().decode("ascii").strip()
-				
-				if line == "":
-					break
-				
-				x, y, compression, compressed_size = line.split(",")
-				x = int(x)
-				y = int(y)
-				minx = min(x, minx)
-				miny = min(y, miny)
-				maxx = max(x+w, maxx)
-				maxy = max(y+h, maxy)
-				
-				compressed_size = int(compressed_size)-1
-				compressed = f.read(1) # TODO
-				tile_bytes = f.read(compressed_size)
-				new_bytes = bytearray([0 for x in range(uncompressed_size)])
-				lzf_decompress(tile_bytes, new_bytes)
-				tile_bytes = new_bytes
-				
-				tiles.append((x, y, tile_bytes))
-			
-			imgw = maxx - minx
-			imgh = maxy - miny
-			
-			clrs = numpy.zeros((imgh,imgw,4), dtype=numpy.uint8)
+		# file doesn't exist
+		if not path in self.root.names:
+			return None
+		
+		with self.root.profile.layer(self, "zip"):
+			f = self.root.zip.read(path)
+		self.root.profile.count("read", len(f), self)
+		f = io.BytesIO(f)
+		
+		version = int(f.readline().decode("ascii").strip().split(" ")[1])
+		w = int(f.readline().decode("ascii").strip().split(" ")[1])
+		h = int(f.readline().decode("ascii").strip().split(" ")[1])
+		pixel_size = int(f.readline().decode("ascii").strip().split(" ")[1])
+		tile_count = int(f.readline().decode("ascii").strip().split(" ")[1])
+		
+		tiles = []
+		for i in range(tile_count):
+			line = f.readline().decode("ascii").strip()
 			
-			for x, y, tile_bytes in tiles:
-				for xx in range(w):
-					for yy in range(h):
-						i = xx + yy * h
-						xxx = x - minx + xx
-						yyy = y - miny + yy
-						clrs[yyy,xxx,0] = tile_bytes[i+off_r]
-						clrs[yyy,xxx,1] = tile_bytes[i+off_g]
-						clrs[yyy,xxx,2] = tile_bytes[i]
-						clrs[yyy,xxx,3] = tile_bytes[i+off_a]
+			if line == "":
+				break
 			
-			image = Image.fromarray(clrs, "RGBA")
-			bbox = image.getbbox()
+			x, y, compression, compressed_size = line.split(",")
+			compressed_size = int(compressed_size)-1
+			flag = f.read(1)[0]
+			tile_bytes = f.read(compressed_size)
 			
-			self.imagedata = image.crop(bbox)
-			self.tile_min_x = minx + bbox[0]
-			self.tile_min_y = miny + bbox[1]
-			self.width = bbox[2]-bbox[0]
-			self.height = bbox[3]-bbox[1]
-			return self.imagedata
-
-
-# https://programtalk.com/python-examples/lzf.decompress/
-# https://github.com/2shady4u/godot-kra-psd-importer/blob/525f433605545a964419934185a98fe865195f11/docs/KRA_FORMAT.md
-# https://github.com/korlibs/korim/commit/d05eff45d0cb156336cf8dd9557731a3ec9243cb#diff-2700b714f88b93eee5490e6c92b54a7f37ec835249e1262a477e5eeaf93469e1
-def lzf_decompress(indata, outdata):
-	iidx = 0
-	oidx = 0
-	in_len = len(indata)
+			tiles.append((int(x), int(y), flag, tile_bytes))
+		
+		return w, h, pixel_size, tiles
 	
-	while iidx < in_len:
-		ctrl = indata[iidx]
-		iidx += 1
+	def get_image_data(self):
+		# not kept around: the caller drops it once the texture is saved.
+		if not hasattr(self, "_filled_tiles"):
+			self.get_bounds()
 		
-		if ctrl < 32:
-			for i in range(0, ctrl+1):
-				outdata[oidx] = indata[iidx]
-				oidx += 1
-				iidx += 1
-		else:
-			lenn = ctrl >> 5
-			if lenn == 7:
-				lenn += indata[iidx]
-				iidx += 1
-			
-			ref = oidx - ((ctrl & 0x1f) << 8) - indata[iidx] - 1
-			iidx += 1
-			
-			for i in range(0, lenn+2):
-				outdata[oidx] = outdata[ref]
-				oidx += 1
-				ref += 1
+		# nothing above the threshold, it's dropped like an empty ora layer.
+		if not getattr(self, "_filled_tiles", None):
+			return None
+		
+		w, h, pixel_size, tiles = self._read_tiles()
+		clrs = numpy.zeros((self.height,self.width,4), dtype=numpy.uint8)
+		
+		# one buffer, reused for every tile. transparent tiles are skipped.
+		buffer = bytearray(w * h * pixel_size)
+		with self.root.profile.layer(self, "tiles"):
+			for x, y, flag, tile_bytes in tiles:
+				if (x, y) in self._filled_tiles:
+					decompress_tile(flag, tile_bytes, buffer)
+					_place_tile(clrs, buffer, x - self.tile_min_x, y - self.tile_min_y, w, h, pixel_size)
+		
+		return Image.fromarray(clrs, "RGBA")
 
 
+# tiles are stored planar: every channel is a w*h plane, in BGRA order.
+# x, y are relative to clrs, parts of the tile outside of it are clipped.
+def _place_tile(clrs, tile_bytes, x, y, w, h, pixel_size=4):
+	planes = numpy.frombuffer(tile_bytes, dtype=numpy.uint8, count=w*h*pixel_size)
+	planes = planes.reshape(pixel_size, h, w)
+	
+	high, wide = clrs.shape[:2]
+	x0, y0 = max(x, 0), max(y, 0)
+	x1, y1 = min(x + w, wide), min(y + h, high)
+	if x0 >= x1 or y0 >= y1:
+		return
+	
+	clrs[y0:y1, x0:x1] = planes[[2, 1, 0, 3], y0-y:y1-y, x0-x:x1-x].transpose(1, 2, 0)
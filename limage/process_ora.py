@@ -1,41 +1,192 @@
-from pyora import Project, TYPE_LAYER, TYPE_GROUP
+from xml.etree import ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+import zipfile, io
 from PIL import Image
 
-
-from . import util, shared, classes
+from . import util, shared, classes, trim
 from .util import get, print, print_error, print_warning
 from .classes import Vec2
+from .profile import get_profile, NO_PROFILE
 
 def process(path, data:dict):
-	file = Project.load(path)
-	wide, high = file.dimensions
-	layers = [x for x in file.children_recursive]
-	root_layers = [l for l in file.children]
-	
-	for l in layers:
-		l._name = l.name
-		l._is_group = l.type == TYPE_GROUP
-		l._is_clone = False # TODO: 
-		l._parent_layer = None if l.parent.parent == None else l.parent
+	with ORARoot(path, get_profile(data)) as file:
+		_process(file, data)
+
+def _process(file, data:dict):
+	with get_profile(data).phase("read"):
+		wide, high = file.width, file.height
+		layers = file.layers_recursive()
+		root_layers = [l for l in file.layers]
 		
-		l._bounds = l.get_image_data(False).getbbox()
-		l._visible = l.visible
-		l._opacity = l.opacity
-		l._blend_mode = BLEND_MODES[l.composite_op]
+		# pngs are decoded once, only the visible part of them is kept until it's saved.
+		file.measure(data["args"].jobs, shared.get_settings(data)["trim_threshold"], data["args"].memory)
 		
-		l.visible = True
-		l.opacity = 1.0
+		for l in layers:
+			l._name = l.name
+			l._is_group = l.is_group
+			l._is_clone = False # TODO:
+			l._parent_layer = l.parent
+			
+			l._bounds = l.bounds
+			l._visible = l.visible
+			l._opacity = l.opacity
+			l._blend_mode = get(BLEND_MODES, l.composite_op, l.composite_op)
+			
+			l.visible = True
+			l.opacity = 1.0
+			
+			if l._is_group:
+				l._layers = [x for x in l.layers]
 		
-		if l._is_group:
-			l._layers = [x for x in l.children]
+		shared.union_group_bounds(layers, lambda c: c.has_pixels())
 	
 	def get_image(l):
-		img = l.get_image_data(False)
-		img = img.crop(l._bounds)
-		return img
+		return l.get_image()
 	
 	shared.finalize(layers, root_layers, data, wide, high, get_image)
+
+class ORABase:
+	def __init__(self):
+		self.layers = []
+	
+	def layers_recursive(self):
+		out = []
+		for l in self.layers:
+			out.append(l)
+			out.extend(l.layers_recursive())
+		return out
+
+class ORARoot(ORABase):
+	def __init__(self, filepath, profile=NO_PROFILE):
+		self.filepath = filepath
+		self.profile = profile
+		
+		# kept open for the layers.
+		self.zip = zipfile.ZipFile(filepath, "r")
+		
+		root = ET.fromstring(self.zip.read("stack.xml"))
+		self.width = int(root.attrib["w"])
+		self.height = int(root.attrib["h"])
+		
+		# openraster lists the top layer first, the other formats go bottom up.
+		stack = root.find("stack")
+		self.layers = [ORALayer(x, self, None) for x in stack if x.tag in ("stack", "layer")]
+		self.layers.reverse()
+	
+	def measure(self, jobs:int=1, threshold:int=0, memory:int=0):
+		# bounds of every layer. the full pngs are dropped as they're trimmed, so only a few are in memory at once.
+		# the visible parts are kept for saving while they fit in memory (MB, 0 for no limit), the rest are decoded again.
+		layers = [l for l in self.layers_recursive() if not l.is_group and l.src]
+		budget = memory * 1024 * 1024
+		kept = 0
+		
+		def measure(item):
+			l, raw = item
+			l.set_bounds(l.decode(raw), threshold)
+		
+		def keep(l):
+			nonlocal kept
+			if l.image == None:
+				return
+			w, h = l.image.size
+			if budget and kept + w * h * 4 > budget:
+				l.image = None
+			else:
+				kept += w * h * 4
+		
+		if jobs <= 1:
+			for l in layers:
+				measure((l, l.read()))
+				keep(l)
+			return
+		
+		# zip reads stay on this thread, png decoding runs in parallel, a few layers at a time.
+		with ThreadPoolExecutor(jobs) as threads:
+			for i in range(0, len(layers), jobs * 2):
+				window = layers[i:i + jobs * 2]
+				list(threads.map(measure, [(l, l.read()) for l in window]))
+				for l in window:
+					keep(l)
 	
+	def close(self):
+		self.zip.close()
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, *args):
+		self.close()
+
+class ORALayer(ORABase):
+	def __init__(self, data, root, parent):
+		self.root = root
+		self.parent = parent
+		self.layers = []
+		self.name = data.attrib.get("name", "")
+		self.is_group = data.tag == "stack"
+		
+		# stacks can be offset too, which moves everything in them.
+		self.x, self.y = int(float(data.attrib.get("x", 0))), int(float(data.attrib.get("y", 0)))
+		if parent != None:
+			self.x += parent.x
+			self.y += parent.y
+		
+		self.visible = data.attrib.get("visibility", "visible") != "hidden"
+		self.opacity = float(data.attrib.get("opacity", 1.0))
+		self.composite_op = data.attrib.get("composite-op", "svg:src-over")
+		self.src = data.attrib.get("src")
+		self.bounds = (0, 0, 1, 1)
+		self.image = None # visible part of the png, until it's handed out
+		self.crop = None # where it is in the png
+		self.filled = False
+		
+		if self.is_group:
+			self.layers = [ORALayer(x, root, self) for x in data if x.tag in ("stack", "layer")]
+			self.layers.reverse()
+	
+	def read(self) -> bytes:
+		with self.root.profile.layer(self, "zip"):
+			raw = self.root.zip.read(self.src)
+		self.root.profile.count("read", len(raw), self)
+		return raw
+	
+	def decode(self, raw:bytes):
+		with self.root.profile.layer(self, "png"):
+			image = Image.open(io.BytesIO(raw))
+			image.load()
+		return image
+	
+	def set_bounds(self, image, threshold:int=0):
+		# only the visible pixels, clipped to the canvas.
+		clip = (-self.x, -self.y, self.root.width - self.x, self.root.height - self.y)
+		with self.root.profile.layer(self, "trim"):
+			crop, image = trim.trim_image(image, threshold, clip)
+		if crop == None:
+			return
+		
+		x0, y0, x1, y1 = crop
+		self.crop = crop
+		self.image = image
+		self.filled = True
+		self.bounds = (self.x + x0, self.y + y0, self.x + x1, self.y + y1)
+	
+	def get_image(self):
+		# handed out once, the caller drops it once the texture is saved. asking again decodes it again.
+		if not self.filled:
+			return None
+		if self.image != None:
+			image, self.image = self.image, None
+			return image
+		image = self.decode(self.read())
+		if image.mode != "RGBA":
+			image = image.convert("RGBA")
+		return image.crop(self.crop)
+	
+	def has_pixels(self) -> bool:
+		if self.is_group:
+			return any(c.has_pixels() for c in self.layers)
+		return self.filled
+
 # normalizing blend modes
 BLEND_MODES:dict = {
 	"svg:src-over": "normal",
@@ -1,53 +1,121 @@
+import time
 from psd_tools import PSDImage
 from psd_tools.constants import Tag
 
 
-from . import util, file, classes, shared
+from . import util, file, classes, shared, trim
 from .util import get, print, print_error, print_warning
 from .classes import Vec2
+from .profile import get_profile
 
 def process(path, data:dict):
-	psd = PSDImage.open(path)
-	wide, high = psd.size
-	layers = list(psd.descendants())
-	root_layers = [l for l in psd]
-	
-	for l in layers:
-		l._name = l.name
-		l._is_group = l.kind == "group"
-		l._is_clone = l.kind == "smartobject"
-		l._parent_layer = None if l.parent == psd else l.parent
-		
-		l._bounds = l.bbox
-		l._visible = l.visible
-		l._opacity = l.opacity / 255.0
-		l._blend_mode = str(l.blend_mode).split(".", 1)[1].lower()
+	with get_profile(data).phase("read"):
+		psd = PSDImage.open(path)
+		wide, high = psd.size
+		layers = list(psd.descendants())
+		root_layers = [l for l in psd]
 		
-		l.visible = True
-		l.opacity = 255
-		
-		if l._is_group:
-			l._layers = [x for x in l]
+		for l in layers:
+			l._name = l.name
+			l._is_group = l.kind == "group"
+			l._is_clone = l.kind == "smartobject"
+			l._parent_layer = None if l.parent == psd else l.parent
+			
+			l._bounds = l.bbox
+			l._visible = l.visible
+			l._opacity = l.opacity / 255.0
+			l._blend_mode = str(l.blend_mode).split(".", 1)[1].lower()
+			
+			l.visible = True
+			l.opacity = 255
+			
+			if l._is_group:
+				l._layers = [x for x in l]
+	
+	costs = []
+	profile = get_profile(data)
+	threshold = shared.get_settings(data)["trim_threshold"]
 	
 	def get_image(l):
-		return l.composite(l.bbox)
+		start = time.perf_counter()
+		reason = get_composite_reason(l)
+		
+		# plain pixel layers can skip psd_tools' effects, clipping + blending.
+		image = None
+		if not reason:
+			with profile.layer(l, "pixels"):
+				image = l.topil()
+		if image == None:
+			reason = reason or "no pixel data"
+			with profile.layer(l, "composite"):
+				image = l.composite(l.bbox)
+		elif image.mode != "RGBA":
+			image = image.convert("RGBA")
+		
+		cost = time.perf_counter() - start
+		costs.append((cost, l._name, reason))
+		print(f"{'composite' if reason else 'pixels'}: {l._name} {cost*1000:.1f}ms {reason or ''}")
+		return image
 	
-	shared.finalize(layers, root_layers, data, wide, high, get_image)
+	# layer bounds from the file are used as is. with a threshold, they have to come from the pixels:
+	# exported layers are decoded to measure them, and the trimmed part is kept until it's saved.
+	# past the memory budget it's dropped, and cropped when it's decoded again.
+	crops = {}
+	kept = {}
 	
-	# shared.update_path(layers, data)
-	# shared.update_child_tags(layers)
-	# shared.determine_drawable(layers)
+	def measure(exported):
+		trim_layers(exported, get_image, threshold, profile, crops, kept, data["args"].memory)
+		shared.union_group_bounds(layers)
 	
-	# # get initial rect
-	# shared.update_area(layers, wide, high, get(settings, "padding"))
-	# main_origin = Vec2(wide, high) * Vec2(0, 0)
-	# main_origin = shared.update_origins(layers, main_origin)
-	# main_origin = shared.localize_area(layers, main_origin)
+	def get_trimmed_image(l):
+		if id(l) in kept:
+			return kept.pop(id(l))
+		if id(l) in crops and crops[id(l)] == None:
+			return None
+		image = get_image(l)
+		if image == None or not id(l) in crops:
+			return image
+		return image.crop(crops[id(l)])
 	
-	# shared.save_layers_images(layers, data, lambda l: l.composite(l._bbox))
+	shared.finalize(layers, root_layers, data, wide, high, get_trimmed_image, measure if threshold else None)
 	
-	# # output
-	# data["size"] = Vec2(wide, high)
-	# data["root"] = {
-	# 	"layers": shared.serialize_layers([l for l in root_layers if not l._ignore_layer])
-	# }
\ No newline at end of file
+	slow = sorted([x for x in costs if x[2]], reverse=True)
+	if slow:
+		total = sum(x[0] for x in slow)
+		print(f"{len(slow)}/{len(costs)} layers needed compositing, {total:.2f}s:")
+		for cost, name, reason in slow:
+			print(f"  {cost*1000:8.1f}ms  {name} ({reason})")
+
+def trim_layers(layers, get_image, threshold:int, profile, crops:dict, kept:dict, memory:int=0):
+	# moves the bounds of layers in to their pixels above threshold. crops gets the part of each image to keep, or None.
+	# kept gets the trimmed images, while they fit in memory (MB, 0 for no limit).
+	budget = memory * 1024 * 1024
+	size = 0
+	for l in layers:
+		image = get_image(l)
+		bounds = None
+		if image != None:
+			with profile.layer(l, "trim"):
+				bounds, image = trim.trim_image(image, threshold)
+		crops[id(l)] = bounds
+		
+		if image != None:
+			w, h = image.size
+			if not budget or size + w * h * 4 <= budget:
+				kept[id(l)] = image
+				size += w * h * 4
+		del image
+		
+		x, y = l._bounds[0], l._bounds[1]
+		l._bounds = (0, 0, 0, 0) if bounds == None else (x + bounds[0], y + bounds[1], x + bounds[2], y + bounds[3])
+
+# why a layer can't just use its own pixels.
+def get_composite_reason(l) -> str:
+	if l.kind != "pixel": return l.kind
+	if l.has_effects(): return "effects"
+	if l.has_clip_layers(): return "clip layers"
+	if l.clipping: return "clipped"
+	if l.has_mask(): return "mask"
+	if l.has_vector_mask(): return "vector mask"
+	if l.fill_opacity != 255: return "fill opacity"
+	return None
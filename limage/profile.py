@@ -0,0 +1,143 @@
+# timings for a build, handed to the processors in data["profile"].
+# phases are the steps of a build, layer steps are per layer (decode, encode...),
+# counters add up bytes. builds without --profile get NO_PROFILE, which does nothing.
+import os, sys, time, threading
+from contextlib import contextmanager, nullcontext
+
+try:
+	import resource
+except ImportError: # windows
+	resource = None
+
+class Profile:
+	def __init__(self):
+		self.start = time.perf_counter()
+		self.phases = {} # name: seconds, added up if a phase runs more than once
+		self.layers = {} # key: { "layer": layer or name, step: seconds, counter: bytes }
+		self.counters = {} # name: bytes, for the whole build
+		self.events = [] # (name, category, start, duration, thread, layer), for traces
+		self.lock = threading.Lock() # layers are saved from threads with --jobs
+	
+	def __bool__(self):
+		return True
+	
+	@contextmanager
+	def phase(self, name:str):
+		self.phases.setdefault(name, 0.0) # listed in the order they start
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			end = time.perf_counter()
+			self.phases[name] += end - start
+			self._event(name, "phase", start, end)
+	
+	@contextmanager
+	def layer(self, layer, step:str):
+		# layer is a layer object, or a name for things like atlas pages.
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			end = time.perf_counter()
+			with self.lock:
+				times = self._get_layer(layer)
+				times[step] = times.get(step, 0.0) + end - start
+			self._event(step, "layer", start, end, layer)
+	
+	def count(self, name:str, size:int, layer=None):
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + size
+			if layer != None:
+				counters = self._get_layer(layer)
+				counters[name] = counters.get(name, 0) + size
+	
+	def _get_layer(self, layer) -> dict:
+		key = layer if isinstance(layer, str) else id(layer)
+		if not key in self.layers:
+			self.layers[key] = { "layer": layer }
+		return self.layers[key]
+	
+	def _event(self, name:str, category:str, start:float, end:float, layer=None):
+		self.events.append((name, category, start - self.start, end - start, threading.get_ident(), layer))
+	
+	def get_layers(self) -> list:
+		# slowest first.
+		out = []
+		for times in list(self.layers.values()):
+			times = dict(times)
+			times["name"] = get_layer_name(times.pop("layer"))
+			out.append(times)
+		return sorted(out, key=lambda t: -sum(v for v in t.values() if isinstance(v, float)))
+	
+	def to_dict(self) -> dict:
+		return {
+			"time": time.perf_counter() - self.start,
+			"phases": self.phases,
+			"counters": self.counters,
+			"peak_rss": get_peak_rss(),
+			"layers": self.get_layers(),
+		}
+	
+	def to_trace(self) -> dict:
+		# chrome's trace event format, open in chrome://tracing or https://ui.perfetto.dev
+		# https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+		pid = os.getpid()
+		events = []
+		for name, category, start, duration, thread, layer in list(self.events):
+			event = { "name": name, "cat": category, "ph": "X", "pid": pid, "tid": thread,
+				"ts": round(start * 1e6, 1), "dur": round(duration * 1e6, 1) }
+			if layer != None:
+				event["args"] = { "layer": get_layer_name(layer) }
+			events.append(event)
+		return { "traceEvents": events, "displayTimeUnit": "ms", "otherData": self.to_dict() }
+	
+	def report(self, top:int=10) -> list:
+		# lines for the log.
+		d = self.to_dict()
+		counters = "".join(f", {k} {v / 1e6:.1f}MB" for k, v in d["counters"].items())
+		lines = [f"profile: {d['time']:.3f}s{counters}, peak rss {d['peak_rss'] / 1e6:.0f}MB"]
+		lines += [f"  {k:20} {v * 1000:9.1f}ms" for k, v in d["phases"].items()]
+		
+		if d["layers"]:
+			lines.append("slowest layers:")
+		for times in d["layers"][:top]:
+			steps = " ".join(f"{k} {v * 1000:.1f}ms" for k, v in times.items() if isinstance(v, float))
+			sizes = " ".join(f"{k} {v / 1e3:.0f}KB" for k, v in times.items() if isinstance(v, int))
+			lines.append(f"  {times['name']}: {steps} {sizes}")
+		return lines
+
+class _NoProfile:
+	def __bool__(self):
+		return False
+	
+	def phase(self, name:str):
+		return _NOTHING
+	
+	def layer(self, layer, step:str):
+		return _NOTHING
+	
+	def count(self, name:str, size:int, layer=None):
+		pass
+
+_NOTHING = nullcontext()
+NO_PROFILE = _NoProfile()
+
+def get_profile(data:dict):
+	return data.get("profile") or NO_PROFILE
+
+def get_layer_name(layer) -> str:
+	if isinstance(layer, str):
+		return layer
+	if hasattr(layer, "_full_path"):
+		return "/".join(layer._full_path)
+	return getattr(layer, "_name", None) or getattr(layer, "name", "?")
+
+def get_peak_rss() -> int:
+	# bytes, the most this process (or one of its finished workers) has used. 0 where unknown.
+	if resource == None:
+		return 0
+	scale = 1 if sys.platform == "darwin" else 1024
+	own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+	return max(own, children) * scale
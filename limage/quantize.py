@@ -0,0 +1,113 @@
+# one palette for a whole document, for the "document" quantize setting.
+# built from a sample of every layer's pixels, then each layer is mapped onto it with numpy.
+import numpy
+from PIL import Image
+
+# rgba, index 0 of every palette. transparent pixels always map here.
+TRANSPARENT = (0, 0, 0, 0)
+
+def sample_pixels(images:list, size:int):
+	# about size visible pixels, every nth pixel of every image.
+	total = sum(image.width * image.height for image in images)
+	step = max(total // size, 1)
+	
+	sample = []
+	for image in images:
+		pixels = numpy.asarray(image.convert("RGBA")).reshape(-1, 4)[::step]
+		sample.append(pixels[pixels[:, 3] > 0])
+	if not sample:
+		return numpy.zeros((0, 4), dtype=numpy.uint8)
+	return numpy.concatenate(sample)
+
+def build_palette(images:list, colors:int=255, method:int=2, size:int=1 << 18):
+	sample = sample_pixels(images, size)
+	palette = [TRANSPARENT]
+	if len(sample):
+		# pillow only quantizes rgba with fast octree (2) or libimagequant (3).
+		method = method if method in (2, 3) else 2
+		strip = Image.frombytes("RGBA", (len(sample), 1), sample.tobytes())
+		quantized = strip.quantize(colors=max(colors - 1, 1), method=method)
+		entries = numpy.asarray(quantized.getpalette("RGBA"), dtype=numpy.uint8).reshape(-1, 4)
+		used = sorted(i for _, i in quantized.getcolors(256))
+		palette += [tuple(c) for c in entries[used] if c[3] > 0]
+	return Palette(palette)
+
+def load_palette(path):
+	# the colours of any image, a palette image keeps its order.
+	image = Image.open(path)
+	if image.mode == "P":
+		entries = numpy.asarray(image.getpalette("RGBA"), dtype=numpy.uint8).reshape(-1, 4)
+	else:
+		entries = numpy.unique(numpy.asarray(image.convert("RGBA")).reshape(-1, 4), axis=0)
+	entries = [tuple(c) for c in entries if tuple(c) != TRANSPARENT]
+	return Palette([TRANSPARENT] + entries[:255])
+
+def get_nearest(colors, palette, chunk:int=1 << 16):
+	# index of the closest palette entry for every colour, by squared rgba distance.
+	# |c - p|^2 = |c|^2 - 2 c.p + |p|^2, and |c|^2 doesn't change which p is closest.
+	p = palette.astype(numpy.float32)
+	p_norm = (p * p).sum(axis=1)
+	out = numpy.empty(len(colors), dtype=numpy.uint8)
+	for i in range(0, len(colors), chunk):
+		c = colors[i:i+chunk].astype(numpy.float32)
+		out[i:i+chunk] = numpy.argmin(p_norm - 2 * (c @ p.T), axis=1)
+	return out
+
+# pixels are looked up in a table over a coarse rgba grid: 5 bits per colour,
+# and 9 alpha steps so fully transparent pixels get their own.
+GRID_SIZE = 32 * 32 * 32 * 9
+
+def get_cells(pixels):
+	# grid cell of every rgba pixel, worked out on the pixels packed into one uint32 each.
+	v = numpy.ascontiguousarray(pixels).view("<u4").reshape(-1)
+	rgb = (v << 7 & 0x7c00) | (v >> 6 & 0x3e0) | (v >> 19 & 0x1f)
+	return rgb * 9 + ((v >> 24) + 31 >> 5)
+
+def get_cell_colors(cells):
+	# the middle of each cell.
+	a, rgb = cells % 9, cells // 9
+	colors = numpy.empty((len(cells), 4), dtype=numpy.uint8)
+	colors[:, 0] = (rgb >> 10) * 8 + 4
+	colors[:, 1] = (rgb >> 5 & 31) * 8 + 4
+	colors[:, 2] = (rgb & 31) * 8 + 4
+	colors[:, 3] = numpy.where(a == 0, 0, numpy.minimum(a * 32 - 16, 255))
+	return colors
+
+class Palette:
+	# colors is (n, 4) uint8 rgba, transparent first.
+	# the table is filled in as cells are seen, so later layers mostly just look up.
+	def __init__(self, colors):
+		self.colors = numpy.asarray(colors, dtype=numpy.uint8)
+		self.table = numpy.zeros(GRID_SIZE, dtype=numpy.uint8)
+		self.filled = numpy.zeros(GRID_SIZE, dtype=bool)
+	
+	def __len__(self):
+		return len(self.colors)
+	
+	def tobytes(self) -> bytes:
+		return self.colors.tobytes()
+	
+	def lookup(self, pixels):
+		cells = get_cells(pixels)
+		new = cells[~self.filled[cells]]
+		if len(new):
+			new = numpy.unique(new)
+			nearest = get_nearest(get_cell_colors(new), self.colors)
+			nearest[new % 9 == 0] = 0
+			self.table[new] = nearest
+			self.filled[new] = True
+		return self.table[cells]
+	
+	def apply(self, image):
+		# rgba image -> indexed image.
+		image = image.convert("RGBA")
+		indices = self.lookup(numpy.asarray(image))
+		out = Image.frombytes("P", image.size, indices.tobytes())
+		out.putpalette(self.tobytes(), "RGBA")
+		return out
+	
+	def to_image(self):
+		# a strip with one pixel per colour, saved as an indexed png.
+		image = Image.frombytes("P", (len(self), 1), bytes(range(len(self))))
+		image.putpalette(self.tobytes(), "RGBA")
+		return image
@@ -1,29 +1,46 @@
-import sys
+import sys, os, io
 from math import ceil, floor
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
 
 import PIL
 from PIL import Image
 from PIL import features
 
-from . import util, file, classes
+from . import util, classes, atlas, composite, quantize
 from .classes import Vec2
 from .util import get, _print, print, print_error, print_warning
+from .profile import get_profile, NO_PROFILE
 
 DEFAULT_SETTINGS:dict = {
 	"seperator": "-",				# change to "/" to folderize
 	
+	# pack textures into shared pages, instead of one file per layer.
+	# true, or a name. layers can pick their own with the "atlas" tag.
+	"atlas": False,
+	"atlas_size": 2048,				# max width + height of a page
+	
+	# store identical textures once. true for within a file,
+	# "batch" to share them between files, in dedupe_directory next to the output folders.
+	"dedupe": False,
+	"dedupe_directory": "_textures",
+	
 	# texture related
-	"scale": 1,						# rescale textures
+	"scale": 1,						# rescale textures. a list ([1, .5, .25]) also saves smaller variants of every texture
 	"origin": [.5, .5],				# multiplied by size of texture
 	
 	"padding": 1,
+	"trim_threshold": 0,			# layers are trimmed to pixels with more alpha (0 - 255) than this. raise it to cut faint fringes
 	
 	# can really decrease file size, but at cost of color range.
 	# https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.quantize
-	"quantize": False,				# decrease size + decrease quality
-	"quantize_method": 3,
+	"quantize": False,				# true: a palette per texture. "document": one palette for all of them
+	"quantize_method": 2,			# 2 = fast octree, 3 = libimagequant (if pillow has it). the only two for rgba
 	"quantize_colors": 255,
+	"quantize_sample": 262144,		# "document": pixels sampled from all layers to build the palette
+	"quantize_palette": None,		# "document": take the palette from this image instead
+	"save_palette": False,			# "document": true or a name, save the palette next to the textures
 	
 	# https://pillow.readthedocs.io/en/stable/handbook/image-file-formats.html
 	# https://docs.godotengine.org/en/stable/getting_started/workflow/assets/importing_images.html
@@ -38,7 +55,7 @@ DEFAULT_SETTINGS:dict = {
 		"method": 3,
 		"quality": 80
 	},
-
+	
 	"JPEG": {
 		"optimize": True,
 		"quality": 80
@@ -47,54 +64,104 @@ DEFAULT_SETTINGS:dict = {
 
 COMPLAINED_ABOUT_WEBP:bool = False
 
+# --quant values
+QUANTIZE_MODES:dict = {
+	"0": False,
+	"1": True,
+	"document": "document",
+}
+
 def get_settings(data):
 	settings = data["settings"]
+	args = data["args"]
 	
-	if not "output" in settings: settings["output"] = util.ARGS.output
-	if not "format" in settings: settings["format"] = util.ARGS.format
-	if not "padding" in settings: settings["padding"] = util.ARGS.padding
-	if not "seperator" in settings: settings["seperator"] = util.ARGS.seperator
-	if not "scale" in settings: settings["scale"] = util.ARGS.scale
+	if not "output" in settings: settings["output"] = data["directory"]
+	if not "format" in settings: settings["format"] = args.format
+	if not "padding" in settings: settings["padding"] = args.padding
+	if not "seperator" in settings: settings["seperator"] = args.seperator
+	if not "scale" in settings and args.scale: settings["scale"] = args.scale
 	
 	if not "quantize" in settings:
-		qenabled, qmethod, qcolors = util.ARGS.quant.split(",")
-		settings["quantize"] = True if qenabled=="1" else False
-		settings["quantize_method"] = int(qmethod)
-		settings["quantize_colors"] = int(qcolors)
+		# "enabled,method,colors", the last two are optional.
+		quant = args.quant.split(",")
+		settings["quantize"] = QUANTIZE_MODES.get(quant[0], False)
+		if len(quant) > 1: settings["quantize_method"] = int(quant[1])
+		if len(quant) > 2: settings["quantize_colors"] = int(quant[2])
 	
 	return util.merge_unique(settings, DEFAULT_SETTINGS)
 
-def get_layer_path(l) -> list:
-	path = []
-	full_path = [l._name]
-	while l._parent_layer:
-		path.insert(0, l._parent_layer._name)
-		full_path.insert(0, l._parent_layer._name)
-		l = l._parent_layer
-	return path, full_path
-
-def get_layer_by_path(layers, path):
-	path = path.split("/")
+def get_scales(settings) -> list:
+	# the first scale is the one the layout uses, the rest are variants.
+	scale = settings["scale"]
+	return list(scale) if isinstance(scale, (list, tuple)) else [scale]
+
+def get_variant_texture(texture:str, scale:float) -> str:
+	# "body.png" at .5 -> "body@0.5x.png"
+	stem, extension = os.path.splitext(texture)
+	return f"{stem}@{scale:g}x{extension}"
+
+def update_tree(layers):
+	# paths + descendants of every layer, in one walk down from the roots.
+	def walk(l, path:list, ancestors:list):
+		l._path = list(path)
+		l._full_path = path + [l._name]
+		for a in ancestors:
+			a._deep_layers.append(l)
+		
+		if hasattr(l, "_layers"):
+			l._deep_layers = []
+			ancestors.append(l)
+			for c in l._layers:
+				walk(c, l._full_path, ancestors)
+			ancestors.pop()
+	
+	for l in layers:
+		if l._parent_layer == None:
+			walk(l, [], [])
+
+def has_bounds(l) -> bool:
+	x, y, r, b = l._bounds
+	return r > x and b > y
+
+def union_group_bounds(layers, has_pixels=has_bounds):
+	# groups cover their children, deepest first. layers are listed depth first.
+	for l in reversed(layers):
+		if l._is_group:
+			bounds = [c._bounds for c in l._layers if has_pixels(c)]
+			if bounds:
+				l._bounds = (min(b[0] for b in bounds), min(b[1] for b in bounds), max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+def get_layer_index(layers) -> dict:
+	# "a/b/c" to layer, first one wins.
+	index = {}
 	for l in layers:
-		if l._full_path == path:
-			return l
-	return None
-
-def get_all_descendants(l, out):
-	for c in l._layers:
-		out.append(c)
-		if hasattr(c, "_layers"):
-			get_all_descendants(c, out)
-	return out
+		index.setdefault("/".join(l._full_path), l)
+	return index
 
-def finalize(layers, root_layers, data, width, height, get_image):
+def get_layer_by_path(layers, path, index:dict=None):
+	if index == None:
+		index = get_layer_index(layers)
+	return index.get(path)
+
+def finalize(layers, root_layers, data, width, height, get_image, measure=None):
+	# measure(exported layers), if given, can update their bounds once it's known which layers are exported.
+	# merged groups are left out, they're flattened + trimmed here first.
 	settings = get_settings(data)
-	
-	update_path(layers, data)
-	update_child_tags(layers)
-	determine_drawable(layers)
-	
-	scale = get(settings, "scale")
+	profile = get_profile(data)
+	
+	with profile.phase("update_path"):
+		update_path(layers, data)
+	with profile.phase("update_child_tags"):
+		update_child_tags(layers)
+	with profile.phase("determine_drawable"):
+		determine_drawable(layers)
+	with profile.phase("update_merged"):
+		get_image = update_merged(layers, get_image, profile, settings["trim_threshold"])
+	if measure:
+		with profile.phase("measure"):
+			measure([l for l in layers if _is_exported(l) and not "merge" in l._tags])
+	
+	scale = get_scales(settings)[0]
 	padding = get(settings, "padding")
 	
 	new_width = int(floor(width * scale))
@@ -102,18 +169,25 @@ def finalize(layers, root_layers, data, width, height, get_image):
 	
 	points = []
 	
-	update_area(layers, new_width, new_height, scale, padding)
+	with profile.phase("update_area"):
+		update_area(layers, new_width, new_height, scale, padding)
 	main_origin = Vec2(new_width, new_height) * Vec2(0, 0)
 	inital_origin = main_origin
 	
-	main_origin = update_origins(points, layers, main_origin)
-	localize_area(layers, main_origin)
+	with profile.phase("update_origins"):
+		main_origin = update_origins(points, layers, main_origin)
+	with profile.phase("localize_area"):
+		localize_area(layers, main_origin)
 	
-	save_layers_images(layers, data, get_image)
+	with profile.phase("update_atlas"):
+		pages = update_atlas(layers, data)
+	with profile.phase("save_layers_images"):
+		save_layers_images(layers, data, get_image, pages)
 	
 	data["size"] = Vec2(new_width, new_height)
 	data["original_size"] = Vec2(width, height)
-	data["root"] = { "layers": serialize_layers([l for l in root_layers if not l._ignore_layer]) }
+	with profile.phase("serialize_layers"):
+		data["root"] = { "layers": serialize_layers([l for l in root_layers if not l._ignore_layer]) }
 	
 	if len(points):
 		data["root"]["points"] = points
@@ -135,22 +209,21 @@ def update_path(layers, data):
 		# layer index
 		l._index = lindex
 		lindex += 1
-		
-		if hasattr(l, "_layers"):
-			l._deep_layers = get_all_descendants(l, [])
+	
+	update_tree(layers)
 	
 	settings = data["settings"]
 	texture_seperator = settings["seperator"]
 	texture_format = settings["format"]
 	texture_extension = get(settings, "extension", texture_format.lower())
+	scales = get_scales(settings)
 	
 	for l in layers:
-		l._path, l._full_path = get_layer_path(l)
-		
 		file_name = texture_seperator.join(l._full_path) + f".{texture_extension}"
 		l._texture = file_name
-		l._texture_dir = util.ARGS.output
-		l._texture_scale = get(settings, "scale")
+		l._texture_dir = settings["output"]
+		l._texture_scale = scales[0]
+		l._texture_variants = scales[1:]
 		
 		l._points = []
 
@@ -175,14 +248,14 @@ def update_child_tags(layers):
 				for c in l._layers:
 					for tag in l._layer_tags:
 						if not tag in c._tags:
-							c._tags[tag] = l._tags[tag]
+							c._tags[tag] = l._layer_tags[tag]
 			
 			# add descendant tags
 			if len(l._deep_layer_tags):
 				for c in l._deep_layers:
 					for tag in l._deep_layer_tags:
 						if not tag in c._tags:
-							c._tags[tag] = l._tags[tag]
+							c._tags[tag] = l._deep_layer_tags[tag]
 		
 		del l._layer_tags
 		del l._deep_layer_tags
@@ -202,8 +275,9 @@ def determine_drawable(layers):
 		# don't export children.
 		for k in ["merge", "origins", "points"]:
 			if k in l._tags:
-				l._ignore_layer = True
-				l._export_image = False
+				if k != "merge":
+					l._ignore_layer = True
+					l._export_image = False
 				for d in l._deep_layers:
 					d._ignore_layer = True
 					d._export_image = False
@@ -218,6 +292,29 @@ def determine_drawable(layers):
 						d._ignore_layer = True
 						d._export_image = False
 
+def update_merged(layers, get_image, profile=NO_PROFILE, threshold=0):
+	# flatten merged groups up front, their bounds are needed for the layout.
+	# returns an image getter that hands out the merged images.
+	merged = {}
+	cache = {}
+	for l in layers:
+		if "merge" in l._tags and hasattr(l, "_layers") and not l._ignore_layer:
+			with profile.layer(l, "merge"):
+				result = composite.merge_group(l, get_image, cache, threshold)
+			if result == None:
+				merged[id(l)] = None
+				continue
+			canvas, x, y = result
+			merged[id(l)] = composite.to_image(canvas)
+			l._bounds = (x, y, x + canvas.shape[1], y + canvas.shape[0])
+	cache.clear()
+	
+	def get_layer_image(l):
+		if id(l) in merged:
+			return merged.pop(id(l))
+		return get_image(l)
+	return get_layer_image
+
 def update_area(layers, max_wide:int, max_high:int, scale:float=1.0, padding:int=1):
 	for l in layers:
 		x, y, r, b = l._bounds
@@ -251,6 +348,8 @@ def update_area(layers, max_wide:int, max_high:int, scale:float=1.0, padding:int
 		l._origin = Vec2(x, y) + l._bounds_size * .5
 
 def update_origins(global_points, layers, main_origin):
+	index = get_layer_index(layers)
+	
 	# update origins
 	for l in layers:
 		# add point to parent
@@ -260,13 +359,13 @@ def update_origins(global_points, layers, main_origin):
 			if l._parent_layer == None:
 				global_points.append(point)
 			else:
-				l.parent._points.append(point)
+				l._parent_layer._points.append(point)
 		
 		# add points to objects
 		if "points" in l._tags:
 			del l._tags["points"]
 			for c in l._layers:
-				target = get_layer_by_path(layers, c._name)
+				target = get_layer_by_path(layers, c._name, index)
 				if target != None:
 					target._points.append({ "name": l._name, "position": c._origin, "tags": c._tags })
 				else:
@@ -277,11 +376,11 @@ def update_origins(global_points, layers, main_origin):
 			if l._parent_layer == None:
 				main_origin = l._origin
 			else:
-				l.parent._origin = l._origin
+				l._parent_layer._origin = l._origin
 		
 		if "origins" in l._tags:
 			for c in l._layers:
-				target = get_layer_by_path(layers, c._name)
+				target = get_layer_by_path(layers, c._name, index)
 				target._origin = c._origin
 	
 	return main_origin
@@ -335,6 +434,63 @@ def localize_area(layers, main_origin):
 	
 	# on_descendants(None, output, localize_to_parent)
 
+def get_atlas_name(l, settings):
+	if "!atlas" in l._tags or "mask" in l._tags:
+		return None
+	name = get(l._tags, "atlas", settings["atlas"])
+	if name == True:
+		return "atlas"
+	return str(name) if name else None
+
+def get_texture_size(l, settings) -> tuple:
+	# size the texture will have after scaling + padding.
+	x, y, r, b = l._bounds
+	w, h = r - x, b - y
+	scale = get(l._tags, "scale", get_scales(settings)[0])
+	if scale != 1:
+		w = ceil(w * scale)
+		h = ceil(h * scale)
+	padding = settings["padding"]
+	return w + padding * 2, h + padding * 2
+
+def update_atlas(layers, data) -> list:
+	# assigns atlas layers a page + region, returns the pages.
+	settings = data["settings"]
+	max_size = settings["atlas_size"]
+	texture_seperator = settings["seperator"]
+	texture_extension = get(settings, "extension", settings["format"].lower())
+	
+	groups = {}
+	for l in layers:
+		if not l._ignore_layer and l._export_image:
+			name = get_atlas_name(l, settings)
+			if name == None:
+				continue
+			
+			w, h = get_texture_size(l, settings)
+			if w > max_size or h > max_size:
+				print_warning(f"{l._texture} is bigger than atlas_size {max_size}, saving it seperately.")
+				continue
+			
+			groups.setdefault(name, []).append((l, w, h))
+	
+	pages = []
+	for name, items in groups.items():
+		placed, sizes = atlas.pack([(w, h) for l, w, h in items], max_size)
+		
+		first = len(pages)
+		for i, size in enumerate(sizes):
+			texture = f"{name}{texture_seperator}{i}.{texture_extension}"
+			pages.append({ "texture": texture, "size": size, "layers": [], "image": None })
+		
+		for (l, w, h), (page, x, y) in zip(items, placed):
+			l._texture = pages[first + page]["texture"]
+			l._atlas = { "page": page, "region": { "x": x, "y": y, "w": w, "h": h } }
+			l._atlas_page = pages[first + page]
+			l._atlas_page["layers"].append(l)
+	
+	return pages
+
 def serialize_layers(layers:list):
 	out = []
 	for l in layers:
@@ -371,63 +527,363 @@ def serialize_layer(l) -> dict:
 	if hasattr(l, "_texture") and l._export_image:
 		out["texture"] = str(l._texture)
 		out["scale"] = l._texture_scale
+		
+		if hasattr(l, "_atlas"):
+			out["atlas"] = l._atlas
+		
+		if len(l._texture_variants):
+			out["variants"] = [serialize_variant(l, scale) for scale in l._texture_variants]
 	
 	if l._is_group:
 		out["layers"] = serialize_layers(l._layers)
 	
 	return out
 
+def serialize_variant(l, scale:float) -> dict:
+	out = { "texture": get_variant_texture(str(l._texture), scale), "scale": scale }
+	
+	# atlas pages are scaled as a whole, so regions shrink with them.
+	if hasattr(l, "_atlas"):
+		ratio = scale / l._texture_scale
+		r = l._atlas["region"]
+		x, y = floor(r["x"] * ratio), floor(r["y"] * ratio)
+		out["atlas"] = { "page": l._atlas["page"], "region": {
+			"x": x, "y": y,
+			"w": ceil((r["x"] + r["w"]) * ratio) - x,
+			"h": ceil((r["y"] + r["h"]) * ratio) - y,
+		}}
+	return out
 
-def save_layers_images(layers, data, image_getter):
-	if util.ARGS.skip_images:
+def save_layers_images(layers, data, image_getter, pages:list=[]):
+	args = data["args"]
+	if args.skip_images:
 		return
 	
+	_check_format_support(data["settings"]["format"])
+	
+	for l, path in _stream_layer_images(layers, data, image_getter, pages, args.jobs, args.memory):
+		print(f"saved: {path}")
+
+def _stream_layer_images(layers, data, image_getter, pages:list=[], jobs:int=1, memory:int=0):
+	# decode -> transform -> encode -> sink, one layer at a time.
+	# yields (layer, path) in layer order, as each texture is written. atlas pages come last.
+	previous = dict(get(get(data, "build", {}), "layers", {}))
+	palette = None
+	if data["settings"]["quantize"] == "document":
+		image_getter, palette = _get_document_palette(layers, data, image_getter)
+	
+	images = _iter_layer_images(layers, data, image_getter, palette)
+	images = _paste_atlas_images(images, data)
+	yield from _save_images(images, data, jobs, memory, palette)
+	yield from _save_atlas_pages(pages, data, previous, palette)
+
+def _get_document_palette(layers, data, image_getter) -> tuple:
+	# one palette for every texture. unless it comes from quantize_palette, it's built from all the layers,
+	# so they're decoded up front and held until they're saved.
+	# returns an image getter for the held images, and the palette.
+	settings = data["settings"]
+	profile = get_profile(data)
+	
+	held = {}
+	with profile.phase("palette"):
+		if settings["quantize_palette"]:
+			palette = quantize.load_palette(settings["quantize_palette"])
+		else:
+			for l in layers:
+				if _is_exported(l):
+					with profile.layer(l, "decode"):
+						held[id(l)] = image_getter(l)
+			
+			images = [x for x in held.values() if x != None]
+			palette = quantize.build_palette(images, settings["quantize_colors"], settings["quantize_method"], settings["quantize_sample"])
+			del images
+	
+	name = settings["save_palette"]
+	if name:
+		name = "palette.png" if name == True else name
+		f = io.BytesIO()
+		palette.to_image().save(f, "PNG")
+		data["sink"].write(Path(settings["output"]) / name, f.getvalue())
+		data["palette"] = name
+	
+	def get_image(l):
+		if id(l) in held:
+			return held.pop(id(l))
+		return image_getter(l)
+	return get_image, palette
+
+def _is_exported(l) -> bool:
+	return not l._ignore_layer and l._export_image and hasattr(l, "_texture")
+
+def _save_images(images, data, jobs:int=1, memory:int=0, palette=None):
+	if jobs <= 1:
+		# images are dropped as soon as they're saved, so only one is held at a time.
+		for l, image in images:
+			for path in _save_layer_image(image, l, data, palette=palette):
+				yield l, path
+			del image
+		return
+	
+	# image getters stay on this thread, since the format readers aren't thread safe.
+	# scaling + quantizing happen on threads (PIL releases the GIL), encoding happens in processes.
+	# when the images in flight would go over the memory budget, wait for the oldest.
+	budget = memory * 1024 * 1024
+	pending = deque()
+	in_flight = 0
+	
+	with ThreadPoolExecutor(jobs) as threads, ProcessPoolExecutor(jobs) as processes:
+		for l, image in images:
+			size = _get_image_bytes(image)
+			while pending and budget and in_flight + size > budget:
+				l2, size2, future = pending.popleft()
+				in_flight -= size2
+				for path in future.result():
+					yield l2, path
+			
+			pending.append((l, size, threads.submit(_save_layer_image, image, l, data, processes, palette)))
+			in_flight += size
+			del image
+		
+		while pending:
+			l, size, future = pending.popleft()
+			for path in future.result():
+				yield l, path
+
+def _paste_atlas_images(images, data):
+	# atlas layers are pasted into their page, the rest pass through.
+	for l, image in images:
+		if not hasattr(l, "_atlas"):
+			yield l, image
+			continue
+		
+		page = l._atlas_page
+		if page["image"] == None:
+			page["image"] = Image.new("RGBA", page["size"], (0,0,0,0))
+		
+		region = l._atlas["region"]
+		image = _resize_layer_images(image, l, data, 1)[0]
+		if image.size != (region["w"], region["h"]):
+			print_warning(f"{l._name} is {image.size}, but was packed as {(region['w'], region['h'])}")
+			image = image.crop((0, 0, region["w"], region["h"]))
+		
+		page["image"].paste(image.convert("RGBA"), (region["x"], region["y"]))
+		del image
+
+def _save_atlas_pages(pages:list, data, previous:dict, palette=None):
+	settings = data["settings"]
+	build = get(data, "build", {})
+	scales = get_scales(settings)
+	profile = get_profile(data)
+	
+	for page in pages:
+		image = page["image"]
+		page["image"] = None
+		
+		# every layer on it was empty
+		if image == None:
+			continue
+		
+		textures = [page["texture"]] + [get_variant_texture(page["texture"], s) for s in scales[1:]]
+		# empty layers were packed too, but never got a checksum.
+		checksum = util.checksum([(getattr(l, "_checksum", None), l._atlas) for l in page["layers"]])
+		if "layers" in build:
+			for texture in textures:
+				build["layers"][texture] = checksum
+		
+		paths = [Path(settings["output"]) / texture for texture in textures]
+		if get(previous, page["texture"]) == checksum and all(data["sink"].exists(p) for p in paths):
+			print(f"unchanged: {paths[0]}")
+			continue
+		
+		# variants are scaled down from the page before them.
+		w, h = page["size"]
+		for scale, texture, path in zip(scales, textures, paths):
+			size = (ceil(w * scale / scales[0]), ceil(h * scale / scales[0]))
+			if image.size != size:
+				with profile.layer(texture, "prepare"):
+					image = image.resize(size, Image.LANCZOS)
+			
+			with profile.layer(texture, "encode"):
+				encoded = _encode_image(_finish_image(image, settings, palette), settings)
+			with profile.layer(texture, "write"):
+				data["sink"].write(path, encoded)
+			profile.count("written", len(encoded), texture)
+			yield None, path
+
+def _get_image_bytes(image) -> int:
+	w, h = image.size
+	return w * h * len(image.getbands())
+
+def _iter_layer_images(layers, data, image_getter, palette=None):
+	# yields layers whose texture needs to be written, along with their image.
+	build = get(data, "build", {})
+	previous = get(build, "layers", {})
+	current = {}
+	
+	dedupe = data["settings"]["dedupe"]
+	textures = {} # checksum -> texture already written
+	profile = get_profile(data)
+	
 	for l in layers:
-		if not l._ignore_layer and l._export_image and hasattr(l, "_texture"):
-			image = image_getter(l)
-			if image != None:
-				_save_layer_image(image, l, data)
+		if _is_exported(l):
+			with profile.layer(l, "decode"):
+				image = image_getter(l)
 			
 			# delete texture field so it won't be added to output struct
-			else:
+			if image == None:
 				del l._texture
+				continue
+			
+			if profile:
+				profile.count("decoded", _get_image_bytes(image), l)
+			
+			# skip if pixels + export settings are the same as last build.
+			# atlas layers are checked per page instead.
+			checksum = _get_layer_checksum(image, l, data["settings"], palette)
+			l._checksum = checksum
+			
+			# identical textures are only stored once.
+			# with "batch" the name comes from the checksum, repeats in this file are still skipped here,
+			# since their first copy may not be written yet.
+			if dedupe and not hasattr(l, "_atlas"):
+				if dedupe == "batch":
+					l._texture = _get_shared_texture(checksum, data["settings"])
+				if checksum in textures:
+					print(f"duplicate: {l._texture} -> {textures[checksum]}")
+					l._texture = textures[checksum]
+					continue
+				textures[checksum] = l._texture
+			
+			if not hasattr(l, "_atlas"):
+				paths = []
+				for texture in _get_layer_textures(l):
+					current[texture] = checksum
+					paths.append(_get_layer_image_path(l, texture))
+				if (get(previous, l._texture) == checksum or dedupe == "batch") and all(data["sink"].exists(p) for p in paths):
+					print(f"unchanged: {paths[0]}")
+					continue
+			
+			yield l, image
+			del image
+	
+	if "build" in data:
+		build["layers"] = current
 
 def m_eight(x):
 	return ((x + 7) & (-8))
 
-def _save_layer_image(image, l, data):
+def _check_format_support(texture_format):
 	global COMPLAINED_ABOUT_WEBP
 	
-	settings = data["settings"]
-	
-	texture_format = settings["format"]
-	texture_format_settings = get(settings, texture_format, {})
-	texture_extension = get(settings, "extension", texture_format.lower())
-	
 	# webp warning
 	if texture_format == "WEBP" and not COMPLAINED_ABOUT_WEBP:
 		webp_supported:bool = features.check_module('webp')
 		if not webp_supported:
 			COMPLAINED_ABOUT_WEBP = True
 			print(f"PILLOW v{PIL.__version__}")
-			print(f"WEBP support: {WEBP_SUPPORTED}")
+			print(f"WEBP support: {webp_supported}")
 			print(f"  libwebp library might not be installed")
 			print(f"  Ubuntu: sudo apt-get install -y libwebp-dev")
+
+def _get_layer_image_path(l, texture:str=None) -> Path:
+	return Path(os.path.normpath(Path(l._texture_dir) / (texture or l._texture)))
+
+def _get_layer_textures(l) -> list:
+	# the texture, then its variants.
+	return [l._texture] + [get_variant_texture(str(l._texture), s) for s in l._texture_variants]
+
+def _get_shared_texture(checksum:str, settings) -> str:
+	# content addressed, so files can be shared between documents + never go stale.
+	texture_extension = get(settings, "extension", settings["format"].lower())
+	output = Path(settings["output"])
+	path = output.parent / settings["dedupe_directory"] / f"{checksum}.{texture_extension}"
+	return os.path.relpath(path, output)
+
+def _get_layer_checksum(image, l, settings, palette=None) -> str:
+	texture_format = settings["format"]
+	params = [
+		image.mode, image.size,
+		get(l._tags, "scale"), "mask" in l._tags,
+		settings["scale"], settings["padding"],
+		settings["quantize"], settings["quantize_method"], settings["quantize_colors"],
+		None if palette is None else util.checksum(palette.tobytes()),
+		texture_format, get(settings, texture_format, {}),
+	]
+	return util.checksum(params, image.tobytes())
+
+def _save_layer_image(image, l, data, processes=None, palette=None) -> list:
+	# the texture + its variants, returns their paths.
+	profile = get_profile(data)
+	with profile.layer(l, "prepare"):
+		images = [_prepare_layer_image(x, l, data, palette) for x in _resize_layer_images(image, l, data)]
+	del image
+	
+	# encoding is the slow part, the sink write stays on this thread.
+	with profile.layer(l, "encode"):
+		if processes:
+			futures = [processes.submit(_encode_image, x, data["settings"]) for x in images]
+			encoded = [f.result() for f in futures]
+		else:
+			encoded = [_encode_image(x, data["settings"]) for x in images]
+	del images
+	
+	paths = [_get_layer_image_path(l, texture) for texture in _get_layer_textures(l)]
+	with profile.layer(l, "write"):
+		for path, raw in zip(paths, encoded):
+			data["sink"].write(path, raw)
+	profile.count("written", sum(len(x) for x in encoded), l)
+	return paths
+
+def _prepare_layer_image(image, l, data, palette=None):
+	# image is already scaled + padded.
+	settings = data["settings"]
+	
+	if "mask" in l._tags:
+		image = image.quantize(colors=2, method=2, dither=Image.NONE)
+	
+	# Optional: Quantize (Can really reduce size, but at cost of colors.)
+	# onto the document palette, or one of its own: 2 = fast octree 3 = libimagequant
+	elif palette is not None:
+		image = palette.apply(image)
+	elif get(settings, "quantize", False):
+		image = image.quantize(method=settings["quantize_method"], colors=settings["quantize_colors"])
+	
+	# generate polygon
+	# TODO: move this somewhere else
+	if "poly" in l._tags:
+		import genpoly
+		poly_path = self.data_path(f"poly_{l.name}", "tscn")
+		points = genpoly.get_points(image, l._texture)
+		save_string(poly_path, points)
+	
+	return _convert_image(image, settings["format"])
+
+def _resize_layer_images(image, l, data, count:int=None) -> list:
+	# the image at every scale (or the first count), padded.
+	# each variant is scaled down from the one before it, not from the full image.
+	settings = data["settings"]
 	
 	# image processing
 	tags = l._tags
 	is_mask = "mask" in tags
-	scale = get(tags, "scale", get(settings, "scale"))
+	scales = get_scales(settings)[:count]
+	scale = get(tags, "scale", scales[0])
 	padding = get(settings, "padding")
 	
-	# Scale.
-	if scale != 1:
-		w, h = image.size
-		w = ceil(w * scale)
-		h = ceil(h * scale)
-		image = image.resize((w, h), Image.NEAREST if is_mask else Image.LANCZOS)
+	w, h = image.size
+	out = []
+	for s in scales:
+		# Scale.
+		s = scale * s / scales[0]
+		if s != 1:
+			size = (ceil(w * s), ceil(h * s))
+			if image.size != size:
+				image = image.resize(size, Image.NEAREST if is_mask else Image.LANCZOS)
+		out.append(_pad_image(image, padding))
 	
-	# Padding.
+	return out
+
+def _pad_image(image, padding:int):
 	if padding != 0:
 		w, h = image.size
 		w += padding*2
@@ -436,22 +892,17 @@ def _save_layer_image(image, l, data):
 		padded.paste(image, (padding, padding))
 		image = padded
 	
-	if is_mask:
-		image = image.quantize(colors=2, method=2, dither=Image.NONE)
-	
-	# Optional: Quantize (Can really reduce size, but at cost of colors.)
-	# 0 = median cut 1 = maximum coverage 2 = fast octree
+	return image
+
+def _finish_image(image, settings, palette=None):
+	# for atlas pages: quantize + convert the whole page at once.
+	if palette is not None:
+		image = palette.apply(image)
 	elif get(settings, "quantize", False):
 		image = image.quantize(method=settings["quantize_method"], colors=settings["quantize_colors"])
-	
-	# generate polygon
-	# TODO: move this somewhere else
-	if "poly" in l._tags:
-		import genpoly
-		poly_path = self.data_path(f"poly_{l.name}", "tscn")
-		points = genpoly.get_points(image, l._texture)
-		save_string(poly_path, points)
-	
+	return _convert_image(image, settings["format"])
+
+def _convert_image(image, texture_format):
 	# RGBA -> RGB
 	if texture_format in ["JPEG"]:
 		# new_image = Image.new("RGB", image.size, (255, 255, 255))
@@ -465,8 +916,11 @@ def _save_layer_image(image, l, data):
 		w, h = image.size
 		image = bg.convert("1").resize((m_eight(w), m_eight(h)), Image.NEAREST)
 	
-	path = Path(l._texture_dir) / l._texture
-	file.make_dir(path.parent)
-	image.save(path, texture_format, **texture_format_settings)
-	
-	print(f"saved: {path}")
\ No newline at end of file
+	return image
+
+def _encode_image(image, settings) -> bytes:
+	texture_format = settings["format"]
+	texture_format_settings = get(settings, texture_format, {})
+	out = io.BytesIO()
+	image.save(out, texture_format, **texture_format_settings)
+	return out.getvalue()
@@ -0,0 +1,151 @@
+# where built files go. textures, json and tables are handed to a sink as bytes,
+# named by their path (as the command line would write them).
+# sinks have to be safe to write to from threads, textures are written in parallel with --jobs.
+import os, io, time, threading, zipfile, tarfile
+from pathlib import Path
+
+from . import file
+
+class DirectorySink:
+	# plain files, relative to root.
+	def __init__(self, root=""):
+		self.root = Path(root)
+	
+	def get_path(self, name) -> Path:
+		return self.root / os.path.normpath(name)
+	
+	def write(self, name, data:bytes):
+		path = self.get_path(name)
+		path.parent.mkdir(parents=True, exist_ok=True)
+		with file.atomic(path) as tmp:
+			with open(tmp, "wb") as f:
+				f.write(data)
+	
+	def read(self, name) -> bytes:
+		path = self.get_path(name)
+		if not path.exists():
+			return None
+		with open(path, "rb") as f:
+			return f.read()
+	
+	def exists(self, name) -> bool:
+		return self.get_path(name).exists()
+	
+	def close(self):
+		pass
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, *args):
+		self.close()
+
+class MemorySink:
+	# name -> bytes, for building straight into memory.
+	def __init__(self, root=""):
+		self.root = root
+		self.files = {}
+		self.lock = threading.Lock()
+	
+	def get_name(self, name) -> str:
+		return _get_name(name, self.root)
+	
+	def write(self, name, data:bytes):
+		with self.lock:
+			self.files[self.get_name(name)] = bytes(data)
+	
+	def read(self, name) -> bytes:
+		return self.files.get(self.get_name(name))
+	
+	def exists(self, name) -> bool:
+		return self.get_name(name) in self.files
+	
+	def close(self):
+		pass
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, *args):
+		self.close()
+
+class BundleSink:
+	# one archive, written as files come in. names are relative to the archive,
+	# so use it as the output: --output art.zip puts each file's folder inside it.
+	# nothing is read back, so every build writes everything.
+	def __init__(self, path):
+		self.path = Path(path)
+		self.path.parent.mkdir(parents=True, exist_ok=True)
+		self.names = set()
+		self.lock = threading.Lock()
+	
+	def get_name(self, name) -> str:
+		return _get_name(name, self.path)
+	
+	def write(self, name, data:bytes):
+		name = self.get_name(name)
+		with self.lock:
+			self.add(name, data)
+			self.names.add(name)
+	
+	def read(self, name) -> bytes:
+		return None
+	
+	def exists(self, name) -> bool:
+		return self.get_name(name) in self.names
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, *args):
+		self.close()
+
+class ZipSink(BundleSink):
+	def __init__(self, path):
+		super().__init__(path)
+		self.zip = zipfile.ZipFile(self.path, "w")
+	
+	def add(self, name:str, data:bytes):
+		# textures are compressed already.
+		compress = zipfile.ZIP_STORED if name.endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+		self.zip.writestr(name, data, compress_type=compress)
+	
+	def close(self):
+		self.zip.close()
+
+class TarSink(BundleSink):
+	def __init__(self, path):
+		super().__init__(path)
+		self.tar = tarfile.open(self.path, "w")
+	
+	def add(self, name:str, data:bytes):
+		info = tarfile.TarInfo(name)
+		info.size = len(data)
+		info.mtime = int(time.time())
+		self.tar.addfile(info, io.BytesIO(data))
+	
+	def close(self):
+		self.tar.close()
+
+STORED_EXTENSIONS:tuple = (".png", ".webp", ".jpeg", ".jpg", ".gif")
+
+SINKS:dict = {
+	"directory": DirectorySink,
+	"zip": ZipSink,
+	"tar": TarSink,
+	"memory": MemorySink,
+}
+
+def _get_name(name, root) -> str:
+	name = os.path.normpath(name)
+	if str(root):
+		name = os.path.relpath(name, root)
+	return Path(name).as_posix()
+
+def get_sink(args):
+	# from the --sink flag. bundles go to --output, or limage.zip / limage.tar.
+	if args.sink == "directory":
+		return DirectorySink()
+	if not args.output:
+		args.output = Path(f"limage.{args.sink}")
+	return SINKS[args.sink](args.output)
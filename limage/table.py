@@ -0,0 +1,189 @@
+# flat binary layer table, an alternative to reading the whole json.
+# every layer is a fixed size record, so a reader can mmap the file and jump to any layer.
+# strings (and anything without a column, as json) live in one utf-8 blob after the records.
+# layers are stored depth first, top to bottom, like the json.
+# numbers are f64, so they read back exactly as they're in the json.
+import struct, mmap, json
+from pathlib import Path
+
+from . import util
+
+MAGIC = b"LIMT"
+VERSION = 2
+
+# magic, version, layer count, size, original size, blob offset + length, document json
+HEADER = struct.Struct("<4sII2d2dII2I")
+
+# parent index (-1 for root), depth, flags, opacity, position, origin, area (x, y, w, h), scale,
+# then offset + length into the blob for: name, texture, blend mode, tags, extra json
+LAYER = struct.Struct("<iHHd2d2d4dd10I")
+
+FLAG_VISIBLE = 1
+FLAG_GROUP = 2
+FLAG_TEXTURE = 4
+
+# keys with their own column, or that can be rebuilt from the table.
+LAYER_COLUMNS:set = {"name", "path", "full_path", "tags", "visible", "opacity", "blend_mode",
+	"position", "origin", "area", "texture", "scale", "layers"}
+
+class _Blob:
+	def __init__(self):
+		self.data = bytearray()
+		self.strings = {}
+	
+	def add(self, s:str) -> tuple:
+		if not s:
+			return 0, 0
+		if not s in self.strings:
+			raw = s.encode("utf-8")
+			self.strings[s] = (len(self.data), len(raw))
+			self.data += raw
+		return self.strings[s]
+
+def _to_json(d) -> str:
+	return json.dumps(d, ensure_ascii=False, separators=(',', ':'), default=util.json_default) if d else ""
+
+def _flatten(layers:list, parent:int, depth:int, out:list):
+	for l in layers:
+		out.append((l, parent, depth))
+		if "layers" in l:
+			_flatten(l["layers"], len(out) - 1, depth + 1, out)
+	return out
+
+def to_bytes(data:dict) -> bytes:
+	blob = _Blob()
+	records = []
+	
+	for l, parent, depth in _flatten(data["root"]["layers"], -1, 0, []):
+		flags = 0
+		if l["visible"]: flags |= FLAG_VISIBLE
+		if "layers" in l: flags |= FLAG_GROUP
+		if "texture" in l: flags |= FLAG_TEXTURE
+		
+		area = l["area"]
+		extra = { k: v for k, v in l.items() if not k in LAYER_COLUMNS }
+		records.append(LAYER.pack(
+			parent, depth, flags, l["opacity"],
+			l["position"]["x"], l["position"]["y"],
+			l["origin"]["x"], l["origin"]["y"],
+			area["x"], area["y"], area["w"], area["h"],
+			util.get(l, "scale", 0.0),
+			*blob.add(l["name"]),
+			*blob.add(util.get(l, "texture", "")),
+			*blob.add(l["blend_mode"]),
+			*blob.add(_to_json(l["tags"])),
+			*blob.add(_to_json(extra))))
+	
+	# everything but the layers goes in the document json.
+	doc = { k: v for k, v in data.items() if k != "root" }
+	doc["root"] = { k: v for k, v in data["root"].items() if k != "layers" }
+	doc = blob.add(_to_json(doc))
+	
+	offset = HEADER.size + LAYER.size * len(records)
+	header = HEADER.pack(MAGIC, VERSION, len(records),
+		data["size"]["x"], data["size"]["y"],
+		data["original_size"]["x"], data["original_size"]["y"],
+		offset, len(blob.data), *doc)
+	return header + b"".join(records) + bytes(blob.data)
+
+class Table:
+	# reads layers straight out of the mapped file, only when asked for.
+	def __init__(self, path):
+		self.path = Path(path)
+		self.file = open(self.path, "rb")
+		self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+		
+		magic, version, self.count, w, h, ow, oh, self.blob_offset, _, doc_offset, doc_length = HEADER.unpack_from(self.buffer, 0)
+		if magic != MAGIC or version != VERSION:
+			self.close()
+			raise ValueError(f"not a limage table: {self.path}")
+		
+		self.size = (w, h)
+		self.original_size = (ow, oh)
+		self._doc = (doc_offset, doc_length)
+	
+	def __len__(self):
+		return self.count
+	
+	def _string(self, offset:int, length:int) -> str:
+		start = self.blob_offset + offset
+		return str(self.buffer[start:start+length], "utf-8")
+	
+	def _json(self, offset:int, length:int):
+		return json.loads(self._string(offset, length)) if length else {}
+	
+	def document(self) -> dict:
+		return self._json(*self._doc)
+	
+	def record(self, i:int) -> tuple:
+		if i < 0 or i >= self.count:
+			raise IndexError(i)
+		return LAYER.unpack_from(self.buffer, HEADER.size + LAYER.size * i)
+	
+	def parent(self, i:int) -> int:
+		return self.record(i)[0]
+	
+	def name(self, i:int) -> str:
+		r = self.record(i)
+		return self._string(r[13], r[14])
+	
+	def full_path(self, i:int) -> list:
+		out = []
+		while i != -1:
+			out.insert(0, self.name(i))
+			i = self.parent(i)
+		return out
+	
+	def children(self, i:int=-1) -> list:
+		return [j for j in range(max(i + 1, 0), self.count) if self.parent(j) == i]
+	
+	def layer(self, i:int) -> dict:
+		# same shape as a json layer, without the "layers".
+		r = self.record(i)
+		full_path = self.full_path(i)
+		out = {
+			"name": full_path[-1],
+			"path": full_path[:-1],
+			"full_path": full_path,
+			"tags": self._json(r[19], r[20]),
+			"visible": bool(r[2] & FLAG_VISIBLE),
+			"opacity": r[3],
+			"blend_mode": self._string(r[17], r[18]),
+			"position": { "x": r[4], "y": r[5] },
+			"origin": { "x": r[6], "y": r[7] },
+			"area": { "x": r[8], "y": r[9], "w": r[10], "h": r[11] },
+		}
+		if r[2] & FLAG_TEXTURE:
+			out["texture"] = self._string(r[15], r[16])
+			out["scale"] = r[12]
+		out.update(self._json(r[21], r[22]))
+		return out
+	
+	def __iter__(self):
+		for i in range(self.count):
+			yield self.layer(i)
+	
+	def close(self):
+		self.buffer.close()
+		self.file.close()
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, *args):
+		self.close()
+
+def load(path) -> dict:
+	# rebuilds the whole json, mostly for checking.
+	with Table(path) as table:
+		data = table.document()
+		data["root"]["layers"] = []
+		found = []
+		for i in range(len(table)):
+			l = table.layer(i)
+			parent = table.parent(i)
+			if table.record(i)[2] & FLAG_GROUP:
+				l["layers"] = []
+			found.append(l)
+			(data["root"]["layers"] if parent == -1 else found[parent]["layers"]).append(l)
+		return data
@@ -0,0 +1,68 @@
+# trims transparent edges, for every format + merged groups.
+# bounds take one reduction over the rows, then one over the columns of the rows that are left.
+# crops of arrays are views, nothing is copied until an image is made from them.
+import sys
+import numpy
+
+def get_bounds(alpha, threshold=0) -> tuple:
+	# x, y, r, b of the pixels with alpha above threshold, or None.
+	if not alpha.size:
+		return None
+	rows = numpy.flatnonzero(alpha.max(axis=1) > threshold)
+	if not len(rows):
+		return None
+	top, bottom = int(rows[0]), int(rows[-1]) + 1
+	cols = numpy.flatnonzero(alpha[top:bottom].max(axis=0) > threshold)
+	return int(cols[0]), top, int(cols[-1]) + 1, bottom
+
+def get_pixel_bounds(pixels, threshold=0) -> tuple:
+	# same, for h x w x 4 arrays with alpha last.
+	# packed 8 bit rgba is read as one uint32 per pixel, alpha being the high byte on little endian,
+	# so the reductions run over contiguous memory instead of every 4th byte.
+	if pixels.dtype == numpy.uint8 and pixels.shape[-1] == 4 and pixels.strides[-2:] == (4, 1) and sys.byteorder == "little":
+		return get_bounds(pixels.view(numpy.uint32)[..., 0], ((int(threshold) + 1) << 24) - 1)
+	return get_bounds(pixels[..., 3], threshold)
+
+def _clip(pixels, clip:tuple) -> tuple:
+	# the part of pixels inside clip (x, y, r, b), and where it starts.
+	if clip == None:
+		return pixels, 0, 0
+	x, y = max(clip[0], 0), max(clip[1], 0)
+	return pixels[y:max(clip[3], y), x:max(clip[2], x)], x, y
+
+def trim(pixels, threshold=0, clip:tuple=None) -> tuple:
+	# h x w x 4 array -> (bounds, view of the bounds), or (None, None) if nothing is left.
+	# clip limits the search, bounds are relative to pixels either way.
+	pixels, x, y = _clip(pixels, clip)
+	bounds = get_pixel_bounds(pixels, threshold)
+	if bounds == None:
+		return None, None
+	l, t, r, b = bounds
+	return (x + l, y + t, x + r, y + b), pixels[t:b, l:r]
+
+def trim_image(image, threshold=0, clip:tuple=None) -> tuple:
+	# same for PIL images, which can't be viewed. copying pixels out to numpy costs more than measuring them,
+	# so the alpha channel is measured by PIL, then the image is cropped once.
+	if image.mode != "RGBA":
+		image = image.convert("RGBA")
+	alpha = image.getchannel("A")
+	if threshold:
+		t = min(int(threshold), 255)
+		alpha = alpha.point([0] * (t + 1) + [255] * (255 - t))
+	
+	x, y = 0, 0
+	if clip != None:
+		w, h = image.size
+		box = (max(clip[0], 0), max(clip[1], 0), max(min(clip[2], w), 0), max(min(clip[3], h), 0))
+		if box[2] <= box[0] or box[3] <= box[1]:
+			return None, None
+		if box != (0, 0, w, h):
+			alpha = alpha.crop(box)
+			x, y = box[0], box[1]
+	
+	bounds = alpha.getbbox()
+	if bounds == None:
+		return None, None
+	l, t, r, b = bounds
+	bounds = (x + l, y + t, x + r, y + b)
+	return bounds, image.crop(bounds)
@@ -1,6 +1,6 @@
-from inspect import stack
 from pathlib import Path
-import json, os, sys, argparse, logging
+import json, os, sys, argparse, logging, hashlib
+from .classes import Vec2
 
 EXTENSIONS:list = [".psd", ".kra", ".ora"]
 SETTINGS:dict = {}
@@ -10,43 +10,100 @@ _errors = 0
 _print = print
 indent = 0
 
-def init():
-	global ARGS
-	
+def get_parser() -> argparse.ArgumentParser:
 	parser = argparse.ArgumentParser(description="Limage v1.0")
-	parser.add_argument("path", help="Path to file or directory.")
+	parser.add_argument("path", nargs="+", help="Path to file, directory or glob.")
 	parser.add_argument("--format", type=str, default="PNG", help="Output texture format.")
 	parser.add_argument("--output", type=str, default="", help="Where to store files.")
-	parser.add_argument("--scale", type=float, default=0.0, help="Scale of textures.")
+	parser.add_argument("--scale", type=parse_scale, default=0.0, help="Scale of textures. A list (1,0.5,0.25) also saves smaller variants.")
 	parser.add_argument("--padding", type=int, default=1, help="Extra padding around textures.")
-	parser.add_argument("--quant", type=str, default="0,0,0", help="Quantize. Reduce file size at cost of color count.")
+	parser.add_argument("--quant", type=str, default="0", help="Quantize: enabled (0, 1 or document for one palette for all layers),method,colors. Reduce file size at cost of color count.")
 	parser.add_argument("--origin", default="0.0,0.0", help="Origin. 0.5,0.5 is center.")
 	parser.add_argument("--seperator", default="-", help="Image name seperator.")
+	parser.add_argument("--jobs", type=int, default=1, help="Encode textures (or build files, for directories) in N parallel processes.")
+	parser.add_argument("--data", default="pretty", choices=["pretty", "compact", "table"], help="Layer data: indented json, one line json, or compact json + a binary layer table.")
+	parser.add_argument("--sink", default="directory", choices=["directory", "zip", "tar"], help="Write files to folders, or stream them into one zip / tar at --output.")
+	parser.add_argument("--profile", action="store_true", help="Time every phase and layer, count bytes decoded + written and peak memory. Written to the log and a chrome trace (.name.trace).")
+	parser.add_argument("--memory", type=int, default=1024, help="Rough limit (MB) for images held in memory: trimmed layers kept from reading until they're saved, and images encoding in parallel. 0 for none.")
+	
+	parser.add_argument("--poll", type=float, default=0.0, help="Watch: check for changes every N seconds, instead of using inotify.")
+	parser.add_argument("--debounce", type=float, default=0.5, help="Watch: wait until a file hasn't changed for N seconds before building it.")
 	
 	parser.add_argument("--print", action="store_true", help="Debug: Print output.")
+	parser.add_argument("--quiet", action="store_true", help="Only log warnings and errors.")
 	parser.add_argument("--skip_images", action="store_true", help="Debug: Skip generating images.")
-	ARGS = parser.parse_args()
-	
-	ARGS.path = Path(ARGS.path)
-	ARGS.output = Path(ARGS.output) if ARGS.output else ARGS.path.parent / ARGS.path.stem
-	
-	if ARGS.path.is_dir():
-		_print("must be file")
-		sys.exit()
+	parser.add_argument("--force", action="store_true", help="Rebuild, even if nothing changed.")
+	return parser
+
+def parse_scale(s:str):
+	# "0.5", or a list of scales "1,0.5,0.25".
+	scales = [float(x) for x in s.split(",")]
+	return scales[0] if len(scales) == 1 else scales
+
+def init(args:list=None):
+	global ARGS
 	
-	elif not ARGS.path.suffix in EXTENSIONS:
-		_print(f"only files of type {EXTENSIONS} allowed.")
-		sys.exit()
+	ARGS = get_parser().parse_args(args)
 	
-	elif not ARGS.path.exists():
-		_print(f"no file at {ARGS.path}")
-		sys.exit()
+	ARGS.output = Path(ARGS.output) if ARGS.output else None
 	
-	else:
-		ARGS.output.mkdir(parents=False, exist_ok=True)
+	for path in ARGS.path:
+		p = Path(path)
 		
-		log_path = ARGS.output / f".{ARGS.path.stem}.log"
-		logging.basicConfig(filename=log_path, level=logging.DEBUG)
+		# directories + globs are expanded later.
+		if p.is_dir() or (not p.exists() and _is_glob(path)):
+			continue
+		
+		elif not p.suffix in EXTENSIONS:
+			_print(f"only files of type {EXTENSIONS} allowed.")
+			sys.exit()
+		
+		elif not p.exists():
+			_print(f"no file at {p}")
+			sys.exit()
+
+def set_args(args):
+	global ARGS
+	ARGS = args
+
+def get_args(**options) -> argparse.Namespace:
+	# the command line defaults, with options in place of flags. doesn't touch ARGS.
+	args = get_parser().parse_args(["."])
+	args.path = []
+	for k, v in options.items():
+		if not hasattr(args, k):
+			raise TypeError(f"unknown option '{k}'")
+		setattr(args, k, v)
+	args.output = Path(args.output) if args.output else None
+	return args
+
+def _is_glob(path:str) -> bool:
+	return any(c in path for c in "*?[")
+
+def get_output(path:Path, batch:bool=False, args=None) -> Path:
+	args = args or ARGS
+	if args.output:
+		return args.output / path.stem if batch else args.output
+	return path.parent / path.stem
+
+REPORT = logging.getLogger("limage.report")
+
+def init_log(log_path:Path):
+	# one log per file, so swap out the handler when building many.
+	root = logging.getLogger()
+	for handler in list(root.handlers):
+		root.removeHandler(handler)
+		handler.close()
+	for handler in list(REPORT.handlers):
+		REPORT.removeHandler(handler)
+	level = logging.WARNING if ARGS and ARGS.quiet else logging.DEBUG
+	logging.basicConfig(filename=log_path, level=level)
+	
+	# reports go in the same log, past the root's level.
+	REPORT.propagate = False
+	REPORT.setLevel(logging.INFO)
+	for handler in root.handlers:
+		REPORT.addHandler(handler)
 
 def _get_color_str(default, **kwargs):
 	return get(kwargs, "color", default)
@@ -54,13 +111,24 @@ def _get_color_str(default, **kwargs):
 def _get_print_str(*args):
 	return " ".join([str(x) for x in args])#.split("\n")
 
-def _get_stack_str(s):
-	s = s[1]
-	script_name = s[1].rsplit('/', 1)[1]
-	script_line = s[2]
-	script_func = s[3]
+def _get_stack_str(depth:int=2):
+	# caller of the print function. cheaper than inspect.stack(), which reads source files.
+	f = sys._getframe(depth)
+	script_name = os.path.basename(f.f_code.co_filename)
+	script_line = f.f_lineno
+	script_func = f.f_code.co_name
 	return f"\t<{script_name}:{script_line} @ {script_func}>"
 
+def _is_enabled(level) -> bool:
+	# skip formatting messages nobody will see.
+	# without the command line, messages only go to logging.
+	return (ARGS and ARGS.print) or logging.root.isEnabledFor(level)
+
+def _emit(level, msg):
+	logging.log(level, msg)
+	if ARGS and ARGS.print:
+		_print(msg)
+
 def _compile_str(clr, lines, stk):
 	tabs = "  " * indent
 	called_from_outside = "called_from" in SETTINGS
@@ -82,51 +150,60 @@ def _compile_str(clr, lines, stk):
 	return "\n".join(out)
 
 def print(*args, **kwargs):
-	clr = _get_color_str("white", **kwargs)
+	if not _is_enabled(logging.INFO):
+		return
 	txt = _get_print_str(*args)
-	stk = _get_stack_str(stack())
-	msg = f"{txt} {stk}"# _compile_str(clr, txt, stk)
-	logging.info(msg)
-	if not ARGS or ARGS.print:
-		_print(msg)
-	
+	stk = _get_stack_str()
+	_emit(logging.INFO, f"{txt} {stk}")
 
 def print_error(e:Exception, path):
 	global _errors
 	_errors += 1
-	clr = _get_color_str("red")
+	if not _is_enabled(logging.ERROR):
+		return
 	txt = _get_print_str(f"{e.__class__.__name__} in {path}\n{e}")
-	stk = _get_stack_str(stack())
-	msg = f"{txt} {stk}"
-	logging.error(msg)
-	if not ARGS or ARGS.print:
-		_print(msg)
+	stk = _get_stack_str()
+	_emit(logging.ERROR, f"{txt} {stk}")
 
 def print_warning(*args):
 	global _warnings
 	_warnings += 1
-	clr = _get_color_str("yellow")
+	if not _is_enabled(logging.WARNING):
+		return
 	txt = _get_print_str("WARNING -", *args)
-	stk = _get_stack_str(stack())
-	msg = f"{txt} {stk}"
-	logging.warning(msg)
-	if not ARGS or ARGS.print:
-		_print(msg)
+	stk = _get_stack_str()
+	_emit(logging.WARNING, f"{txt} {stk}")
+
+def print_report(*args):
+	# info that was asked for (like --profile), on its own logger so --quiet keeps it.
+	txt = _get_print_str(*args)
+	REPORT.info(txt)
+	if ARGS and ARGS.print:
+		_print(txt)
 
 def print_json(d, **kwargs):
+	if not _is_enabled(logging.INFO):
+		return
 	clr = _get_color_str("cyan", **kwargs)
-	txt = _get_print_str(json.dumps(d, indent=4))
-	stk = _get_stack_str(stack())
-	msg = _compile_str(clr, txt, stk)
-	logging.info(msg)
-	if not ARGS or ARGS.print:
-		_print(msg)
+	txt = _get_print_str(json.dumps(d, indent=4, default=json_default))
+	stk = _get_stack_str()
+	_emit(logging.INFO, _compile_str(clr, txt, stk))
+
+def json_default(o):
+	# for types json doesn't know. anything else is written as a string.
+	if isinstance(o, Vec2):
+		return o.to_dict()
+	return str(o)
+
+# encoding happens in one pass, json_default is only called for the odd types.
+JSON_PRETTY = json.JSONEncoder(allow_nan=False, ensure_ascii=False, indent=4, default=json_default)
+JSON_COMPACT = json.JSONEncoder(allow_nan=False, ensure_ascii=False, separators=(',', ':'), default=json_default)
 
 def to_json(data:dict, **kwargs) -> str:
 	if "pretty" in kwargs and kwargs["pretty"]:
-		return json.dumps(data, allow_nan=False, ensure_ascii=False, indent=4)
+		return JSON_PRETTY.encode(data)
 	else:
-		return json.dumps(data, allow_nan=False, ensure_ascii=False, separators=(',', ':'))
+		return JSON_COMPACT.encode(data)
 
 def to_json_safe(data:dict, **kwargs) -> str:
 	# sanitize
@@ -138,6 +215,15 @@ def to_json_safe(data:dict, **kwargs) -> str:
 	dig(data, clean)
 	return to_json(data, **kwargs)
 
+def checksum(*parts) -> str:
+	h = hashlib.blake2b(digest_size=16)
+	for p in parts:
+		if isinstance(p, (bytes, bytearray, memoryview)):
+			h.update(p)
+		else:
+			h.update(json.dumps(p, sort_keys=True, default=json_default).encode("utf-8"))
+	return h.hexdigest()
+
 def get(d:dict, k:str, default=None):
 	if isinstance(d, (list, tuple)):
 		if k >= 0 and k < len(d):
@@ -176,7 +262,7 @@ def str2var(s:str) -> object:
 			return s
 
 def dict2str(data:dict) -> str:
-	return json.dumps(data, separators=(',', ':'))
+	return json.dumps(data, separators=(',', ':'), default=json_default)
 
 def merge(t:dict, p:dict) -> dict:
 	for k in p:
@@ -0,0 +1,189 @@
+# rebuilds files as they're saved. stays running, so imports, settings and
+# the last build of every file (with its layer checksums) are kept in memory.
+import os, sys, time, struct, select, ctypes, ctypes.util
+from pathlib import Path
+
+from . import util, file
+from .util import get, _print, print_error, print_warning, EXTENSIONS
+
+# https://man7.org/linux/man-pages/man7/inotify.7.html
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE_SELF = 0x400
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY | IN_DELETE_SELF
+
+def is_watched(path:Path) -> bool:
+	return path.suffix in EXTENSIONS and not path.name.startswith(".")
+
+class InotifyWatcher:
+	def __init__(self, directories:list):
+		self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+		self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+		self.dirs = {}
+		for d in directories:
+			for sub in file.collect_dirs(d, []):
+				self.add(sub)
+	
+	def add(self, directory:Path):
+		wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK)
+		if wd < 0:
+			print_warning(f"can't watch {directory}")
+		else:
+			self.dirs[wd] = Path(directory)
+	
+	def wait(self, timeout:float) -> set:
+		# changed files, or an empty set after timeout.
+		ready, _, _ = select.select([self.fd], [], [], timeout)
+		if not ready:
+			return set()
+		
+		changed = set()
+		try:
+			buffer = os.read(self.fd, 1 << 16)
+		except BlockingIOError:
+			return changed
+		
+		i = 0
+		while i < len(buffer):
+			wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(buffer, i)
+			i += INOTIFY_EVENT.size
+			name = os.fsdecode(buffer[i:i+length].rstrip(b"\0"))
+			i += length
+			
+			if not wd in self.dirs:
+				continue
+			
+			if mask & IN_DELETE_SELF:
+				del self.dirs[wd]
+				continue
+			
+			path = self.dirs[wd] / name
+			if mask & IN_ISDIR:
+				# new folders get watched too, and may already have files.
+				if mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith("."):
+					self.add(path)
+					changed.update(p for p in file.get_paths(path, [], extensions=EXTENSIONS))
+			elif is_watched(path):
+				changed.add(path)
+		return changed
+	
+	def close(self):
+		os.close(self.fd)
+
+class PollWatcher:
+	def __init__(self, directories:list, interval:float=1.0):
+		self.directories = directories
+		self.interval = interval
+		self.stats = self.scan()
+	
+	def scan(self) -> dict:
+		stats = {}
+		for d in self.directories:
+			for p in file.get_paths(d, [], extensions=EXTENSIONS):
+				try:
+					s = p.stat()
+					stats[p] = (s.st_mtime_ns, s.st_size)
+				except FileNotFoundError:
+					pass
+		return stats
+	
+	def wait(self, timeout:float) -> set:
+		time.sleep(min(timeout, self.interval))
+		stats = self.scan()
+		changed = { p for p, s in stats.items() if self.stats.get(p) != s }
+		self.stats = stats
+		return changed
+	
+	def close(self):
+		pass
+
+def get_watcher(directories:list):
+	if not util.ARGS.poll and sys.platform.startswith("linux"):
+		try:
+			return InotifyWatcher(directories)
+		except (OSError, AttributeError) as e:
+			print_warning(f"inotify not available ({e}), polling instead.")
+	return PollWatcher(directories, util.ARGS.poll or 1.0)
+
+def get_stat(path:Path):
+	try:
+		s = path.stat()
+		return s.st_mtime_ns, s.st_size
+	except FileNotFoundError:
+		return None
+
+def run(paths:list, build):
+	# build(path, batch, old_build) -> result, like limage.process_file.
+	directories = []
+	only = set()
+	for p in paths:
+		p = Path(p)
+		if p.is_dir():
+			directories.append(p)
+		else:
+			# single files, watch their folder but only build them.
+			directories.append(p.parent)
+			only.add(p.resolve())
+	
+	batch = len(paths) > 1 or len(only) == 0
+	builds = {}
+	
+	def rebuild(path:Path):
+		try:
+			result = build(path, batch, get(builds, path))
+			builds[path] = result["build"]
+			_print(f"{result['status']:>8}  {result['time']:7.2f}s  {path}")
+		except Exception as e:
+			print_error(e, path)
+	
+	def wanted(path:Path) -> bool:
+		return is_watched(path) and (not only or path.resolve() in only)
+	
+	watcher = get_watcher(directories)
+	
+	# catch up first, this also fills the cache.
+	for d in directories:
+		for p in sorted(file.get_paths(d, [], extensions=EXTENSIONS)):
+			if wanted(p):
+				rebuild(p)
+	
+	debounce = util.ARGS.debounce
+	pending = {} # path: (time of last change, stat)
+	_print(f"watching {', '.join(str(d) for d in directories)} ({type(watcher).__name__}). ctrl+c to stop.")
+	
+	try:
+		while True:
+			now = time.monotonic()
+			timeout = min([t + debounce - now for t, _ in pending.values()], default=1.0)
+			
+			for p in watcher.wait(max(timeout, 0.01)):
+				if wanted(p):
+					pending[p] = (time.monotonic(), get_stat(p))
+			
+			# only build once a file has been left alone for a bit.
+			now = time.monotonic()
+			for p, (t, stat) in list(pending.items()):
+				if now - t < debounce:
+					continue
+				
+				current = get_stat(p)
+				del pending[p]
+				if current == None:
+					builds.pop(p, None)
+				elif current != stat:
+					pending[p] = (now, current) # still being written
+				else:
+					rebuild(p)
+	
+	except KeyboardInterrupt:
+		_print("stopped watching.")
+	finally:
+		watcher.close()
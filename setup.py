@@ -1,7 +1,7 @@
 from setuptools import setup
 setup(
 	name='limage',
-	packages=['limage'],
+	packages=['limage', 'limage.bench'],
 	version='0.3',
 	description='Decompile layered images from Photoshop, Krita, Gimp...',
 	keywords=["PHOTOSHOP", "KRITA", "GIMP", "LAYERED IMAGES"],
@@ -19,8 +19,10 @@ setup(
 	install_requires=[
 		"numpy",
 		"psd-tools",	# photoshop
-		"pyora"			# open raster
 	],
+	extras_require={
+		"fast": ["python-lzf"],	# compiled lzf for krita tiles
+	},
 	classifiers=[
 		'Development Status :: 3 - Alpha',
 		'Intended Audience :: Game Developers',
@@ -0,0 +1,66 @@
+# the python + native lzf decoders must give krita's tiles back byte for byte.
+import numpy
+import pytest
+from limage import compression
+from limage.bench import generate, micro
+
+def get_tiles() -> dict:
+	# the micro bench samples, plus planar bgra tiles like krita writes: a soft edged shape on transparency.
+	tiles = micro.get_lzf_samples()
+	size = 64
+	yy, xx = numpy.mgrid[:size, :size]
+	shape = numpy.zeros((size, size, 4), dtype=numpy.uint8)
+	inside = (xx - 20) ** 2 + (yy - 30) ** 2 < 24 ** 2
+	shape[inside] = (200, 120, 40, 255)
+	shape[..., 3] = numpy.where(inside, numpy.minimum(255, (xx * 4)), 0)
+	tiles["shape"] = shape[..., [2, 1, 0, 3]].transpose(2, 0, 1).tobytes()
+	tiles["gradient"] = numpy.broadcast_to((xx + yy).astype(numpy.uint8)[..., None], (size, size, 4))[..., [2, 1, 0, 3]].transpose(2, 0, 1).tobytes()
+	return tiles
+
+TILES = get_tiles()
+
+def decode(decompress, packed:bytes, size:int) -> bytes:
+	out = bytearray(size)
+	assert decompress(packed, out) == size
+	return bytes(out)
+
+@pytest.mark.parametrize("name", TILES)
+def test_python(name):
+	raw = TILES[name]
+	packed = generate.lzf_compress_python(raw)
+	assert decode(compression.lzf_decompress_python, packed, len(raw)) == raw
+	assert compression.decompress_tile(compression.RAW_DATA_FLAG, raw, bytearray(len(raw))) == len(raw)
+
+@pytest.mark.parametrize("name", TILES)
+def test_native(name):
+	lzf = pytest.importorskip("lzf")
+	raw = TILES[name]
+	for packed in (lzf.compress(raw), generate.lzf_compress_python(raw)):
+		if not packed:
+			continue # incompressible, krita stores it raw
+		native = decode(compression.DECOMPRESSORS["native"], packed, len(raw))
+		assert native == decode(compression.lzf_decompress_python, packed, len(raw)) == raw
+
+def test_kra_tiles():
+	# whole tiles through the kra writer, read back with every decoder.
+	pixels = numpy.zeros((100, 90, 4), dtype=numpy.uint8)
+	pixels[10:80, 5:70] = (10, 200, 90, 255)
+	grid = numpy.zeros((128, 128, 4), dtype=numpy.uint8)
+	grid[:100, :90] = pixels
+	
+	data = generate.kra_tiles(pixels, 0, 0)
+	_, _, body = data.partition(b"DATA ")
+	count, _, body = body.partition(b"\n")
+	for i in range(int(count)):
+		info, _, body = body.partition(b"\n")
+		x, y, _, size = info.split(b",")
+		x, y, size = int(x), int(y), int(size)
+		flag, packed, body = body[0], body[1:size], body[size:]
+		tile = grid[y:y+64, x:x+64][..., [2, 1, 0, 3]].transpose(2, 0, 1).tobytes()
+		for decompress in compression.DECOMPRESSORS.values():
+			assert decode_tile(flag, packed, decompress) == tile
+
+def decode_tile(flag:int, packed:bytes, decompress) -> bytes:
+	out = bytearray(64 * 64 * 4)
+	assert compression.decompress_tile(flag, packed, out, decompress) == len(out)
+	return bytes(out)